@@ -0,0 +1,334 @@
+# -*- encoding: utf-8 -*-
+"""
+action_db.py
+SQLite-Index für die Aktions-Historie (ergänzt die actions_log.json-Dateien).
+Funktionen:
+ - record_action(): log_action-Einträge im Hintergrund in logs/actions.sqlite schreiben
+ - ingest_json_logs(): vorhandene actions_log.json inkrementell nachladen
+ - Indizes auf Gerät, Template, Aktion und Zeit
+ - Fertige Abfragen: Trefferquote und Median-Confidence pro Template,
+   Zyklen pro Stunde pro Emulator, Aktionszahlen pro Gerät, letzte Aktionen (HTML-Report)
+
+CLI:
+    python action_db.py ingest
+    python action_db.py stats [--hours 24]
+"""
+
+import datetime
+import hashlib
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import atexit
+
+from raw_airtest_pro import ABS_LOG_DIR, init_log_dir
+
+DB_FILE = os.path.join(ABS_LOG_DIR, "actions.sqlite")
+FLUSH_INTERVAL = 0.5   # Sekunden zwischen zwei Schreibvorgängen
+FLUSH_BATCH = 500      # maximale Zeilen pro Transaktion
+FLUSH_TIMEOUT = 10.0   # so lange wartet flush() höchstens auf den Schreiber
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS actions (
+    id          INTEGER PRIMARY KEY,
+    ts          REAL NOT NULL,
+    device      TEXT NOT NULL,
+    action      TEXT NOT NULL,
+    template    TEXT,
+    x           INTEGER,
+    y           INTEGER,
+    confidence  REAL,
+    extra       TEXT,
+    source      TEXT,
+    seq         INTEGER,
+    UNIQUE (source, seq)
+);
+CREATE INDEX IF NOT EXISTS idx_actions_device_ts   ON actions(device, ts);
+CREATE INDEX IF NOT EXISTS idx_actions_template_ts ON actions(template, action, ts);
+CREATE INDEX IF NOT EXISTS idx_actions_action_ts   ON actions(action, ts);
+CREATE INDEX IF NOT EXISTS idx_actions_ts          ON actions(ts);
+CREATE TABLE IF NOT EXISTS ingested_files (
+    path       TEXT PRIMARY KEY,
+    entries    INTEGER NOT NULL,
+    generation TEXT
+);
+"""
+
+
+# ------------------ Verbindung ------------------
+def connect(db_file=None):
+    if db_file is None:
+        init_log_dir()
+        db_file = DB_FILE
+    conn = sqlite3.connect(db_file, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(ingested_files)")]
+    if "generation" not in columns:  # Datenbanken aus der ersten Version
+        conn.execute("ALTER TABLE ingested_files ADD COLUMN generation TEXT")
+    return conn
+
+
+def log_generation(first_entry):
+    """
+    Kennung einer Ausgabe einer actions_log.json: Hash des ersten Eintrags.
+    Wird die Datei gelöscht, rotiert oder nach einem JSON-Fehler neu begonnen,
+    beginnt eine neue Ausgabe (und seq wieder bei 0).
+    """
+    raw = json.dumps(first_entry, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+
+def source_id(path, first_entry):
+    """source-Spalte: Datei + Ausgabe, damit (source, seq) auch nach einem Neubeginn eindeutig bleibt"""
+    return f"{path}#{log_generation(first_entry)}"
+
+
+def _template_name(template):
+    """Nur der Dateiname, damit Windows- und Linux-Pfade zusammenpassen"""
+    if not template:
+        return None
+    return os.path.basename(str(template).replace("\\", "/"))
+
+
+def _to_row(entry, device_addr, source=None, seq=None):
+    try:
+        ts = datetime.datetime.strptime(entry["timestamp"], TIME_FORMAT).timestamp()
+    except (KeyError, TypeError, ValueError):
+        ts = time.time()
+    pos = entry.get("position")
+    x, y = (int(pos[0]), int(pos[1])) if pos else (None, None)
+    extra = entry.get("extra")
+    return (ts, str(device_addr).replace(":", "_"), entry.get("action"), _template_name(entry.get("template")),
+            x, y, entry.get("confidence"), json.dumps(extra, ensure_ascii=False, default=str) if extra else None,
+            source, seq)
+
+
+def _insert(conn, rows):
+    # (source, seq) = JSON-Datei/Ausgabe + Index: Live-Einträge und späterer JSON-Import doppeln sich nicht
+    conn.executemany(
+        "INSERT OR IGNORE INTO actions (ts, device, action, template, x, y, confidence, extra, source, seq) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        rows)
+
+
+# ------------------ Hintergrund-Schreiber ------------------
+class _Writer:
+    def __init__(self, db_file=None):
+        self.db_file = db_file
+        self.q = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+        self.disabled = False
+
+    def put(self, row):
+        if self.disabled:
+            return
+        if self.thread is None:
+            with self.lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self._run, name="action-db", daemon=True)
+                    self.thread.start()
+                    atexit.register(self.flush)
+        self.q.put(row)
+
+    def _drain(self):
+        while True:
+            try:
+                self.q.get_nowait()
+            except queue.Empty:
+                return
+            self.q.task_done()
+
+    def _run(self):
+        try:
+            conn = connect(self.db_file)
+        except (sqlite3.Error, OSError) as e:
+            # z. B. gesperrt, keine Rechte, falscher Pfad: JSON-Logs laufen weiter, nur ohne Index
+            print(f"[WARN] action_db: Datenbank nicht verfügbar ({e}) – SQLite-Index deaktiviert")
+            self.disabled = True
+            self._drain()
+            return
+        while True:
+            rows = [self.q.get()]
+            while len(rows) < FLUSH_BATCH:
+                try:
+                    rows.append(self.q.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with conn:
+                    _insert(conn, rows)
+            except sqlite3.Error as e:
+                print(f"[WARN] action_db: Schreiben fehlgeschlagen: {e}")
+            finally:
+                for _ in rows:
+                    self.q.task_done()
+            time.sleep(FLUSH_INTERVAL)
+
+    def flush(self, timeout=FLUSH_TIMEOUT):
+        """Wartet, bis alle gepufferten Einträge geschrieben sind (höchstens timeout Sekunden)"""
+        if self.thread is None:
+            return True
+        if self.disabled or not self.thread.is_alive():
+            self._drain()
+            return False
+        deadline = time.time() + timeout
+        with self.q.all_tasks_done:
+            while self.q.unfinished_tasks:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    print(f"[WARN] action_db: {self.q.unfinished_tasks} Einträge nach {timeout:.0f}s nicht geschrieben")
+                    return False
+                self.q.all_tasks_done.wait(remaining)
+        return True
+
+
+_writer = _Writer()
+
+
+def record_action(entry, device_addr="global", source=None, seq=None):
+    """
+    Ein log_action-Eintrag (dict) asynchron in die Datenbank schreiben.
+    source/seq: source_id() der JSON-Datei und Index des Eintrags darin (für duplikatfreien Import)
+    """
+    _writer.put(_to_row(entry, device_addr, source, seq))
+
+
+def flush(timeout=FLUSH_TIMEOUT):
+    return _writer.flush(timeout)
+
+
+# ------------------ JSON-Import ------------------
+def ingest_json_logs(log_dir=ABS_LOG_DIR, db_file=None):
+    """
+    Lädt actions_log.json (global + pro Gerät) inkrementell: pro Datei wird gespeichert,
+    welche Ausgabe (log_generation) wie weit übernommen wurde. Gibt die Anzahl neuer Zeilen zurück.
+    """
+    conn = connect(db_file)
+    added = 0
+    files = [(os.path.join(log_dir, "actions_log.json"), "global")]
+    if os.path.isdir(log_dir):
+        for name in sorted(os.listdir(log_dir)):
+            files.append((os.path.join(log_dir, name, "actions_log.json"), name))
+    for path, device in files:
+        if not os.path.exists(path):
+            continue
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"[WARN] {path} übersprungen: {e}")
+            continue
+        if not data:
+            continue
+        generation = log_generation(data[0])
+        row = conn.execute("SELECT entries, generation FROM ingested_files WHERE path = ?", (path,)).fetchone()
+        done = 0
+        if row and row[1] in (generation, None) and row[0] <= len(data):
+            done = row[0]  # sonst: Datei wurde neu begonnen
+        source = source_id(path, data[0])
+        new = data[done:]
+        with conn:
+            _insert(conn, [_to_row(e, device, source, done + i) for i, e in enumerate(new)])
+            conn.execute("INSERT OR REPLACE INTO ingested_files (path, entries, generation) VALUES (?, ?, ?)",
+                         (path, len(data), generation))
+        added += len(new)
+    conn.close()
+    print(f"[DB] {added} Einträge importiert")
+    return added
+
+
+# ------------------ Abfragen ------------------
+def _since(hours):
+    return time.time() - hours * 3600 if hours else 0.0
+
+
+def template_hit_rate(conn, hours=None):
+    """[(template, versuche, treffer, quote)] für exists-Aktionen"""
+    rows = conn.execute(
+        """SELECT template, COUNT(*), SUM(x IS NOT NULL)
+           FROM actions WHERE action = 'exists' AND template IS NOT NULL AND ts >= ?
+           GROUP BY template ORDER BY template""", (_since(hours),)).fetchall()
+    return [(t, n, hits, hits / n if n else 0.0) for t, n, hits in rows]
+
+
+def median_confidence(conn, hours=None):
+    """{template: median der confidence aller Treffer}"""
+    rows = conn.execute(
+        """SELECT template, confidence FROM actions
+           WHERE action = 'exists' AND confidence IS NOT NULL AND ts >= ?
+           ORDER BY template, confidence""", (_since(hours),)).fetchall()
+    values = {}
+    for t, c in rows:
+        values.setdefault(t, []).append(c)
+    result = {}
+    for t, vs in values.items():
+        mid = len(vs) // 2
+        result[t] = vs[mid] if len(vs) % 2 else (vs[mid - 1] + vs[mid]) / 2
+    return result
+
+
+def cycles_per_hour(conn, hours=None):
+    """
+    [(device, zyklen, stunden, zyklen_pro_stunde)] aus den 'cycle'-Einträgen von gardening_loop.
+    n Zeitstempel spannen n-1 Zyklusabstände auf; mit weniger als 2 Zyklen ist die Rate None.
+    """
+    rows = conn.execute(
+        """SELECT device, COUNT(*), MIN(ts), MAX(ts) FROM actions
+           WHERE action = 'cycle' AND ts >= ? GROUP BY device ORDER BY device""", (_since(hours),)).fetchall()
+    result = []
+    for device, n, first, last in rows:
+        span = (last - first) / 3600.0
+        result.append((device, n, span, (n - 1) / span if n >= 2 and span > 0 else None))
+    return result
+
+
+def recent_actions(conn, hours=24, limit=1000):
+    """Neueste Aktionen zuerst: [(ts, device, action, template, x, y, confidence, extra-dict)]"""
+    rows = conn.execute(
+        """SELECT ts, device, action, template, x, y, confidence, extra FROM actions
+           WHERE ts >= ? ORDER BY ts DESC, id DESC LIMIT ?""", (_since(hours), limit)).fetchall()
+    return [row[:7] + (json.loads(row[7]) if row[7] else None,) for row in rows]
+
+
+def actions_per_device(conn, hours=None):
+    """{device: {action: anzahl}}"""
+    result = {}
+    for device, action, n in conn.execute(
+            "SELECT device, action, COUNT(*) FROM actions WHERE ts >= ? GROUP BY device, action",
+            (_since(hours),)):
+        result.setdefault(device, {})[action] = n
+    return result
+
+
+def print_stats(hours=None, db_file=None):
+    conn = connect(db_file)
+    medians = median_confidence(conn, hours)
+    print("Template                          Versuche  Treffer  Quote   Median-Conf")
+    for t, n, hits, rate in template_hit_rate(conn, hours):
+        med = medians.get(t)
+        print(f"{t:<32} {n:>8} {hits:>8} {rate:>6.1%}   {med if med is None else f'{med:.3f}'}")
+    print("\nGerät                  Zyklen   Stunden  Zyklen/h")
+    for device, n, span, rate in cycles_per_hour(conn, hours):
+        print(f"{device:<22} {n:>6} {span:>9.2f} {'-' if rate is None else f'{rate:.1f}':>9}")
+    conn.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Aktions-Historie in SQLite")
+    parser.add_argument("command", choices=["ingest", "stats"])
+    parser.add_argument("--hours", type=float, default=None, help="nur die letzten N Stunden")
+    parser.add_argument("--db", default=None)
+    args = parser.parse_args()
+    if args.command == "ingest":
+        ingest_json_logs(db_file=args.db)
+    else:
+        print_stats(args.hours, args.db)
@@ -0,0 +1,235 @@
+# -*- encoding: utf-8 -*-
+"""
+adb_client.py
+Reiner Python-Client für das adb-Server-Protokoll (localhost:5037), ohne adb-Prozess.
+Funktionen:
+ - host:-Requests (version, devices, connect, track-devices)
+ - shell: / exec: Services pro Gerät
+ - Verbindungspool pro Gerät: Sockets werden vorab verbunden und per
+   host:transport an das Gerät gebunden; ein Befehl kostet dann nur noch
+   den Service-Request selbst
+
+Hinweis zum Protokoll: nach einem shell:/exec:-Service gehört der Socket dem
+Service und wird vom Server geschlossen. "Wiederverwenden" heißt daher: der Pool
+hält fertig vorbereitete (transport-gebundene) Sockets bereit und füllt im
+Hintergrund nach.
+"""
+
+import os
+import shlex
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+ADB_HOST = os.environ.get("ADB_SERVER_HOST", "127.0.0.1")
+ADB_PORT = int(os.environ.get("ANDROID_ADB_SERVER_PORT", "5037"))
+POOL_SIZE = 2
+CONNECT_TIMEOUT = 5.0
+
+
+class AdbError(ConnectionError):
+    """FAIL-Antwort oder Protokollfehler des adb-Servers"""
+
+
+# ------------------ Protokoll-Grundlagen ------------------
+def send_request(sock, payload):
+    data = payload.encode("utf-8")
+    sock.sendall(f"{len(data):04x}".encode("ascii") + data)
+
+
+def recv_exact(sock, n):
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise AdbError("adb-Server hat die Verbindung geschlossen")
+        buf += chunk
+    return bytes(buf)
+
+
+def read_block(sock):
+    length = int(recv_exact(sock, 4), 16)
+    return recv_exact(sock, length) if length else b""
+
+
+def read_status(sock):
+    status = recv_exact(sock, 4)
+    if status == b"OKAY":
+        return
+    if status == b"FAIL":
+        raise AdbError(read_block(sock).decode("utf-8", "replace"))
+    raise AdbError(f"Unerwartete Antwort vom adb-Server: {status!r}")
+
+
+def recv_all(sock):
+    chunks = []
+    while True:
+        chunk = sock.recv(65536)
+        if not chunk:
+            return b"".join(chunks)
+        chunks.append(chunk)
+
+
+def quote_args(args):
+    """Argumentliste -> Shell-Kommando (wie der adb-Client es an shell: schickt)"""
+    return " ".join(shlex.quote(str(a)) for a in args)
+
+
+# ------------------ Pool ------------------
+class _DevicePool:
+    """Vorbereitete, an ein Gerät gebundene Sockets"""
+
+    def __init__(self, client, serial, size):
+        self.client = client
+        self.serial = serial
+        self.size = size
+        self.idle = []
+        self.lock = threading.Lock()
+        self.refilling = 0
+
+    def _open(self):
+        sock = self.client._connect()
+        try:
+            send_request(sock, f"host:transport:{self.serial}")
+            read_status(sock)
+        except Exception:
+            sock.close()
+            raise
+        return sock
+
+    def _refill(self):
+        try:
+            sock = self._open()
+        except (OSError, AdbError):
+            sock = None
+        with self.lock:
+            self.refilling -= 1
+            if sock is not None:
+                if len(self.idle) < self.size:
+                    self.idle.append(sock)
+                    return
+        if sock is not None:
+            sock.close()
+
+    def _schedule_refill(self):
+        with self.lock:
+            missing = self.size - len(self.idle) - self.refilling
+            if missing <= 0:
+                return
+            self.refilling += missing
+        for _ in range(missing):
+            self.client._executor.submit(self._refill)
+
+    def acquire(self):
+        with self.lock:
+            sock = self.idle.pop() if self.idle else None
+        self._schedule_refill()
+        return (sock, True) if sock is not None else (self._open(), False)
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for sock in idle:
+            sock.close()
+
+
+# ------------------ Client ------------------
+class AdbClient:
+    def __init__(self, host=ADB_HOST, port=ADB_PORT, pool_size=POOL_SIZE):
+        self.host = host
+        self.port = port
+        self.pool_size = pool_size
+        self._pools = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="adb-pool")
+
+    def _connect(self, timeout=CONNECT_TIMEOUT):
+        return socket.create_connection((self.host, self.port), timeout=timeout)
+
+    def _pool(self, serial):
+        with self._lock:
+            pool = self._pools.get(serial)
+            if pool is None:
+                pool = _DevicePool(self, serial, self.pool_size)
+                self._pools[serial] = pool
+            return pool
+
+    # ---------- host: ----------
+    def host_request(self, payload, timeout=CONNECT_TIMEOUT):
+        """host:-Request mit längenpräfixierter Antwort (version, devices, connect …)"""
+        with self._connect(timeout) as sock:
+            send_request(sock, payload)
+            read_status(sock)
+            try:
+                return read_block(sock).decode("utf-8", "replace")
+            except (AdbError, ValueError):
+                return ""
+
+    def version(self):
+        return int(self.host_request("host:version") or "0", 16)
+
+    def devices(self):
+        return self.host_request("host:devices")
+
+    def connect_device(self, addr):
+        return self.host_request(f"host:connect:{addr}")
+
+    # ---------- Geräte-Services ----------
+    def service(self, serial, service, timeout=None):
+        """
+        Führt einen Geräte-Service (shell:…, exec:…) aus und liefert die komplette Ausgabe.
+        Ein vorbereiteter Socket aus dem Pool wird bevorzugt; ist er inzwischen
+        ungültig (Gerät neu verbunden), wird einmal mit frischem Socket wiederholt.
+        """
+        pool = self._pool(serial)
+        sock, pooled = pool.acquire()
+        try:
+            try:
+                sock.settimeout(timeout)
+                send_request(sock, service)
+                read_status(sock)
+            except (OSError, AdbError):
+                if not pooled:
+                    raise
+                sock.close()
+                sock = pool._open()
+                sock.settimeout(timeout)
+                send_request(sock, service)
+                read_status(sock)
+            return recv_all(sock)
+        finally:
+            sock.close()
+
+    def shell(self, serial, args, timeout=None):
+        cmd = args if isinstance(args, str) else quote_args(args)
+        return self.service(serial, f"shell:{cmd}", timeout)
+
+    def exec_out(self, serial, args, timeout=None):
+        cmd = args if isinstance(args, str) else quote_args(args)
+        return self.service(serial, f"exec:{cmd}", timeout)
+
+    def drop(self, serial):
+        """Verwirft die vorbereiteten Sockets eines Geräts (z. B. nach einem Reconnect)"""
+        with self._lock:
+            pool = self._pools.pop(serial, None)
+        if pool is not None:
+            pool.close()
+
+    def close(self):
+        with self._lock:
+            pools, self._pools = list(self._pools.values()), {}
+        for pool in pools:
+            pool.close()
+
+
+# ------------------ Globaler Client ------------------
+_CLIENT = None
+_CLIENT_LOCK = threading.Lock()
+
+
+def get_client():
+    global _CLIENT
+    with _CLIENT_LOCK:
+        if _CLIENT is None:
+            _CLIENT = AdbClient()
+        return _CLIENT
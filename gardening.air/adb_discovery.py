@@ -0,0 +1,205 @@
+# -*- encoding: utf-8 -*-
+"""
+adb_discovery.py
+Plattformunabhängige adb-Suche und automatische Geräteerkennung.
+Funktionen:
+ - resolve_adb_path(): adb aus Umgebung (ADB_PATH, ANDROID_SDK_ROOT/ANDROID_HOME), PATH
+   oder dem mitgelieferten platform-tools-Ordner
+ - DeviceTracker: hält eine Verbindung zum adb-Server (host:track-devices auf 5037)
+   und meldet neu gestartete / verschwundene Emulatoren sofort per Callback
+ - Emu.csv bleibt die Freigabeliste: nur Geräte mit Flag 'x' werden bearbeitet;
+   nicht gelistete Geräte (z. B. ein per USB angeschlossenes Handy) nur mit
+   ADB_INCLUDE_UNLISTED=1 bzw. gardening.py --include-unlisted
+"""
+
+import os
+import sys
+import shutil
+import socket
+import subprocess
+import threading
+import time
+
+from emulator_loader import load_emulator_table
+from adb_client import ADB_HOST, ADB_PORT, AdbClient, AdbError, send_request, read_status, read_block
+
+RECONNECT_DELAY = 2.0
+INCLUDE_UNLISTED = os.environ.get("ADB_INCLUDE_UNLISTED", "0") == "1"
+
+# Alter Standardpfad (Windows) als letzte Möglichkeit
+LEGACY_WINDOWS_ADB = r"C:\Users\User\AppData\Local\Android\Sdk\platform-tools\adb.exe"
+BUNDLED_PLATFORM_TOOLS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "platform-tools")
+
+
+# ------------------ adb finden ------------------
+def resolve_adb_path():
+    """
+    Reihenfolge: $ADB_PATH, $ANDROID_SDK_ROOT / $ANDROID_HOME, PATH,
+    mitgelieferte platform-tools, alter Windows-Pfad.
+    """
+    exe = "adb.exe" if sys.platform.startswith("win") else "adb"
+    env_path = os.environ.get("ADB_PATH")
+    if env_path:
+        return env_path
+
+    candidates = []
+    for var in ("ANDROID_SDK_ROOT", "ANDROID_HOME"):
+        sdk = os.environ.get(var)
+        if sdk:
+            candidates.append(os.path.join(sdk, "platform-tools", exe))
+    on_path = shutil.which("adb")
+    if on_path:
+        candidates.append(on_path)
+    candidates.append(os.path.join(BUNDLED_PLATFORM_TOOLS, exe))
+    candidates.append(LEGACY_WINDOWS_ADB)
+
+    for path in candidates:
+        if os.path.isfile(path):
+            return path
+    # Nichts gefunden: "adb" und hoffen, dass es zur Laufzeit im PATH liegt
+    return "adb"
+
+
+# ------------------ adb-Server-Protokoll ------------------
+def parse_device_list(text):
+    """'serial\\tstate\\n...' -> {serial: state}"""
+    devices = {}
+    for line in text.splitlines():
+        parts = line.strip().split("\t")
+        if len(parts) >= 2:
+            devices[parts[0]] = parts[1]
+    return devices
+
+
+def ensure_adb_server(adb_path=None):
+    """Startet den adb-Server einmalig, falls auf 5037 niemand lauscht"""
+    try:
+        socket.create_connection((ADB_HOST, ADB_PORT), timeout=1.0).close()
+        return True
+    except OSError:
+        pass
+    try:
+        subprocess.run([adb_path or resolve_adb_path(), "start-server"], capture_output=True, timeout=15)
+        socket.create_connection((ADB_HOST, ADB_PORT), timeout=2.0).close()
+        return True
+    except (OSError, subprocess.SubprocessError):
+        print("[WARN] adb-Server nicht erreichbar")
+        return False
+
+
+# ------------------ Tracker ------------------
+class DeviceTracker:
+    """
+    Verfolgt Geräte über host:track-devices.
+    on_added(addr, meta) / on_removed(addr) werden aus dem Tracker-Thread aufgerufen.
+    include_unlisted: Geräte, die nicht in Emu.csv stehen, ebenfalls bearbeiten
+    (Standard: aus, siehe ADB_INCLUDE_UNLISTED).
+    Geräte, die in Emu.csv OHNE Flag 'x' stehen, werden immer ignoriert.
+    """
+
+    def __init__(self, on_added, on_removed=None, csv_path="Emu.csv", include_unlisted=None,
+                 host=ADB_HOST, port=ADB_PORT):
+        self.on_added = on_added
+        self.on_removed = on_removed
+        self.csv_path = csv_path
+        self.include_unlisted = INCLUDE_UNLISTED if include_unlisted is None else include_unlisted
+        self.host = host
+        self.port = port
+        self.client = AdbClient(host, port)
+        self.online = {}  # addr -> meta
+        self._skipped = set()  # nicht gelistete Geräte, die schon gemeldet wurden
+        self._stop = threading.Event()
+        self._sock = None
+        self._thread = None
+
+    def _table(self):
+        try:
+            return load_emulator_table(self.csv_path)
+        except FileNotFoundError:
+            return {}
+
+    def _wanted(self, addr, table):
+        meta = table.get(addr)
+        if meta is None:
+            if not self.include_unlisted and addr not in self._skipped:
+                self._skipped.add(addr)
+                print(f"[INFO] {addr} steht nicht in {self.csv_path} – ignoriert "
+                      f"(freigeben mit Flag 'x' oder --include-unlisted)")
+            return self.include_unlisted, {"active": True, "emu": "", "user": ""}
+        return meta["active"], meta
+
+    def connect_tcp_emulators(self):
+        """host:connect für aktive TCP-Emulatoren aus Emu.csv (z. B. MEmu 127.0.0.1:21503)"""
+        for addr, meta in self._table().items():
+            if meta["active"] and ":" in addr:
+                try:
+                    print(f"[INFO] adb connect {addr}: {self.client.connect_device(addr)}")
+                except (OSError, AdbError) as e:
+                    print(f"[WARN] adb connect {addr} fehlgeschlagen: {e}")
+
+    def _apply(self, devices):
+        table = self._table()
+        current = {}
+        for addr, state in devices.items():
+            if state != "device":
+                continue
+            wanted, meta = self._wanted(addr, table)
+            if wanted:
+                current[addr] = meta
+        for addr in list(self.online):
+            if addr not in current:
+                del self.online[addr]
+                print(f"[INFO] Emulator getrennt: {addr}")
+                if self.on_removed:
+                    self.on_removed(addr)
+        for addr, meta in current.items():
+            if addr not in self.online:
+                self.online[addr] = meta
+                print(f"[INFO] Emulator erkannt: {addr} ({meta.get('emu') or '?'} / {meta.get('user') or '?'})")
+                self.on_added(addr, meta)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                with socket.create_connection((self.host, self.port), timeout=5.0) as sock:
+                    self._sock = sock
+                    send_request(sock, "host:track-devices")
+                    read_status(sock)
+                    sock.settimeout(None)
+                    while not self._stop.is_set():
+                        self._apply(parse_device_list(read_block(sock).decode("utf-8", "replace")))
+            except (OSError, ValueError) as e:
+                if self._stop.is_set():
+                    break
+                print(f"[WARN] track-devices unterbrochen: {e} – neuer Versuch in {RECONNECT_DELAY}s")
+                self._stop.wait(RECONNECT_DELAY)
+            finally:
+                self._sock = None
+
+    def start(self):
+        self.connect_tcp_emulators()
+        self._thread = threading.Thread(target=self._run, name="adb-track-devices", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        sock = self._sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        if self._thread:
+            self._thread.join(timeout=2.0)
+
+
+if __name__ == "__main__":
+    print(f"adb: {resolve_adb_path()}")
+    ensure_adb_server()
+    tracker = DeviceTracker(on_added=lambda a, m: None).start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        tracker.stop()
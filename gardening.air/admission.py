@@ -0,0 +1,259 @@
+# -*- encoding: utf-8 -*-
+"""
+admission.py
+Host-weite Zugangskontrolle für alle Emulatoren.
+Funktionen:
+ - Kontingente (Budgets) für Screenshots (pro Sekunde), Matching (gleichzeitige
+   CPU-Plätze) und Eingaben (pro Sekunde), gemeinsam für alle Geräte-Threads
+ - Wartende werden nach Priorität bedient: Geräte kurz vor einer Belohnung
+   (Ernte bereit) vor normalen Abläufen vor wiederholtem Polling
+ - Alterung: wer lange wartet, steigt langsam auf (kein Verhungern)
+ - Screenshot- und Eingabe-Kontingente gelten nur für echte Geräte; simulierte
+   Geräte aus fake_adb sind ausgenommen (Matching zählt für alle, es kostet echte CPU)
+
+Konfiguration über Umgebungsvariablen:
+    ADMISSION=0                      ausschalten
+    ADMISSION_SCREENCAPS_PER_S=8     vorsichtiger Startwert, NICHT gemessen: am eigenen Host
+                                     mit `measure` bestimmen (s. u.)
+    ADMISSION_MATCH_SLOTS=<CPU-Kerne>
+    ADMISSION_INPUTS_PER_S=20
+
+Screenshot-Durchsatz messen (echte Geräte, ohne Kontingent, 1..N Geräte parallel):
+    python admission.py measure <gerät> [<gerät> ...] [--seconds 5]
+Vorgeschlagen wird der Durchsatz, bevor die mittlere Screenshot-Dauer über das
+1,5-fache der Dauer mit einem Gerät steigt (adb-Server/Host gesättigt).
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+# Prioritäten
+POLL = 0      # Wiederholung, nachdem ein Template noch nicht da war
+NORMAL = 1
+REWARD = 2    # Ernte/Aufsammeln steht an
+
+AGING_SECONDS = 2.0  # so lange Wartezeit entspricht einer Prioritätsstufe
+
+ENABLED = os.environ.get("ADMISSION", "1") != "0"
+SCREENCAPS_PER_S = float(os.environ.get("ADMISSION_SCREENCAPS_PER_S", "8"))
+MATCH_SLOTS = int(os.environ.get("ADMISSION_MATCH_SLOTS", str(os.cpu_count() or 2)))
+INPUTS_PER_S = float(os.environ.get("ADMISSION_INPUTS_PER_S", "20"))
+
+
+class _Waiter:
+    __slots__ = ("priority", "since")
+
+    def __init__(self, priority, since):
+        self.priority = priority
+        self.since = since
+
+
+class Budget:
+    """
+    Kontingent mit Token-Rate (rate pro Sekunde, burst = Vorrat) und/oder
+    einer festen Zahl gleichzeitiger Plätze (concurrency).
+    """
+
+    def __init__(self, name, rate=None, burst=None, concurrency=None):
+        self.name = name
+        self.rate = rate
+        self.burst = burst or rate or 1.0
+        self.concurrency = concurrency
+        self.tokens = self.burst
+        self.in_use = 0
+        self.granted = 0
+        self.waited = 0.0
+        self._last = time.monotonic()
+        self._waiters = []
+        self._cond = threading.Condition()
+
+    def _refill(self, now):
+        if self.rate:
+            self.tokens = min(self.burst, self.tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def _free(self):
+        return ((not self.rate or self.tokens >= 1.0)
+                and (self.concurrency is None or self.in_use < self.concurrency))
+
+    def _first(self, now):
+        return max(self._waiters, key=lambda w: (w.priority + (now - w.since) / AGING_SECONDS, -w.since))
+
+    def acquire(self, priority=NORMAL):
+        """Blockiert, bis ein Token/Platz frei ist und kein wichtigerer Wartender ansteht"""
+        if not self.rate and self.concurrency is None:
+            return 0.0
+        with self._cond:
+            start = time.monotonic()
+            me = _Waiter(priority, start)
+            self._waiters.append(me)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if self._free() and self._first(now) is me:
+                        break
+                    timeout = 0.5
+                    if self.rate and self.tokens < 1.0:
+                        timeout = min(timeout, (1.0 - self.tokens) / self.rate)
+                    self._cond.wait(timeout)
+            finally:
+                self._waiters.remove(me)
+            if self.rate:
+                self.tokens -= 1.0
+            if self.concurrency is not None:
+                self.in_use += 1
+            waited = time.monotonic() - start
+            self.granted += 1
+            self.waited += waited
+            self._cond.notify_all()
+            return waited
+
+    def release(self):
+        if self.concurrency is None:
+            return
+        with self._cond:
+            self.in_use -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def admit(self, priority=NORMAL):
+        self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def configure(self, rate=None, concurrency=None):
+        with self._cond:
+            if rate is not None:
+                self.rate = rate
+                self.burst = rate
+                self.tokens = min(self.tokens, self.burst)
+            if concurrency is not None:
+                self.concurrency = concurrency
+            self._cond.notify_all()
+
+
+SCREENCAPS = Budget("screencap", rate=SCREENCAPS_PER_S)
+MATCHING = Budget("matching", concurrency=MATCH_SLOTS)
+INPUTS = Budget("input", rate=INPUTS_PER_S)
+
+
+# ------------------ Prioritäten pro Gerät ------------------
+_priority = {}
+
+
+def set_priority(device_addr, level):
+    """Setzt die Priorität eines Geräts, gibt die vorherige zurück"""
+    prev = _priority.get(device_addr, NORMAL)
+    _priority[device_addr] = level
+    return prev
+
+
+def priority_of(device_addr):
+    return _priority.get(device_addr, NORMAL)
+
+
+@contextmanager
+def polling(device_addr, attempt):
+    """Ab dem zweiten Versuch einer Suche zählt das Gerät als Polling (niedrigste Stufe)"""
+    if attempt == 0:
+        yield
+        return
+    prev = set_priority(device_addr, min(priority_of(device_addr), POLL))
+    try:
+        yield
+    finally:
+        _priority[device_addr] = prev
+
+
+def admit(budget, device_addr=None, priority=None):
+    """
+    Context-Manager: ein Token/Platz aus `budget`. priority=None -> aktuelle Priorität
+    des Geräts; eingereihte Eingaben geben die Priorität vom Zeitpunkt des Einreihens mit.
+    """
+    if not ENABLED:
+        return nullcontext()
+    return budget.admit(priority_of(device_addr) if priority is None else priority)
+
+
+def configure(screencaps_per_s=None, match_slots=None, inputs_per_s=None):
+    SCREENCAPS.configure(rate=screencaps_per_s)
+    MATCHING.configure(concurrency=match_slots)
+    INPUTS.configure(rate=inputs_per_s)
+
+
+def stats():
+    """{budget: {"granted": n, "mean_wait": s}}"""
+    return {b.name: {"granted": b.granted, "mean_wait": b.waited / b.granted if b.granted else 0.0}
+            for b in (SCREENCAPS, MATCHING, INPUTS)}
+
+
+# ------------------ Messung ------------------
+SATURATION = 1.5   # Faktor auf die Screenshot-Dauer mit einem Gerät, ab dem der Host als gesättigt gilt
+
+
+def measure_screencaps(devices, seconds=5.0):
+    """
+    Screenshot-Durchsatz ohne Kontingent, für 1..len(devices) gleichzeitig aufnehmende Geräte.
+    Gibt [(geräte, screenshots/s, mittlere Dauer in s)] zurück.
+    """
+    global ENABLED
+    from concurrent.futures import ThreadPoolExecutor
+    from raw_airtest_pro import raw_screenshot
+
+    def worker(addr):
+        count, busy = 0, 0.0
+        name = "measure_" + str(addr).replace(":", "_") + ".png"
+        end = time.monotonic() + seconds
+        while time.monotonic() < end:
+            t0 = time.monotonic()
+            raw_screenshot(addr, name, crop=False)
+            busy += time.monotonic() - t0
+            count += 1
+        return count, busy
+
+    prev, ENABLED = ENABLED, False
+    rows = []
+    try:
+        for n in range(1, len(devices) + 1):
+            with ThreadPoolExecutor(max_workers=n) as pool:
+                results = list(pool.map(worker, devices[:n]))
+            total = sum(c for c, _ in results)
+            rows.append((n, total / seconds, sum(b for _, b in results) / max(total, 1)))
+    finally:
+        ENABLED = prev
+    return rows
+
+
+def suggest_screencap_rate(rows):
+    """Durchsatz der letzten Stufe vor der Sättigung (s. SATURATION)"""
+    if not rows:
+        return None
+    base = rows[0][2]
+    best = rows[0][1]
+    for _, rate, latency in rows:
+        if latency > base * SATURATION:
+            break
+        best = max(best, rate)
+    return best
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Host-Kontingente (admission) ausmessen")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_measure = sub.add_parser("measure")
+    p_measure.add_argument("devices", nargs="+")
+    p_measure.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+    # über den Modulnamen: raw_airtest_pro prüft admission.ENABLED, nicht __main__.ENABLED
+    import admission
+    rows = admission.measure_screencaps(args.devices, args.seconds)
+    for n, rate, latency in rows:
+        print(f"[INFO] {n} Geräte: {rate:.1f} Screenshots/s, {latency * 1000:.0f} ms je Screenshot")
+    print(f"[OK] Vorschlag: ADMISSION_SCREENCAPS_PER_S={suggest_screencap_rate(rows):.0f}")
@@ -0,0 +1,279 @@
+# -*- encoding: utf-8 -*-
+"""
+calibrate_thresholds.py
+Threshold- und ROI-Kalibrierung aus gelabelten Screenshots.
+Funktionen:
+ - Labels aus logs/calibration/labels.json und/oder aus den actions_log.json
+   (Treffer von exists_raw_logged mit gespeichertem Screenshot). Log-Labels enthalten
+   nur den besten Treffer pro exists-Aufruf und liefern daher nur Positive
+ - Alle Templates über den ganzen Korpus in einem Durchgang matchen
+   (TemplateAtlas, TM_CCOEFF_NORMED wie im Betrieb)
+ - Pro Template: Scores der echten Treffer vs. bester Score an falschen Stellen,
+   Vorschlag für threshold und Suchbereich (ROI), Vergleich mit dem aktuellen Wert
+ - Ergebnis in logs/calibration/suggestions.json
+
+Label-Format (Pfade relativ zu labels.json, Koordinaten = Mittelpunkt im Frame):
+    {"frames": {"f001.png": {"Empty.png": [[120, 540], [360, 540]], "Pot.png": null}}}
+null = Template ist auf diesem Frame nicht sichtbar.
+
+CLI:
+    python calibrate_thresholds.py [--labels PFAD] [--from-actions-log] [--scale 1.0]
+"""
+
+import json
+import os
+
+from raw_airtest_pro import ABS_LOG_DIR, load_image_bgr
+
+CALIBRATION_DIR = os.path.join(ABS_LOG_DIR, "calibration")
+LABELS_FILE = os.path.join(CALIBRATION_DIR, "labels.json")
+SUGGESTIONS_FILE = os.path.join(CALIBRATION_DIR, "suggestions.json")
+
+HIT_RADIUS = 6          # Pixel: so weit darf ein Treffer vom Label abweichen
+FALSE_TAP_WEIGHT = 3.0  # ein falscher Tap kostet mehr als ein verpasster Zyklus
+ROI_MARGIN = 24         # Pixel Rand um die beobachteten Positionen
+CHUNK = 8               # Frames pro score_maps_batch-Aufruf
+
+
+# ------------------ Labels ------------------
+class PositivesOnly(list):
+    """
+    Unvollständige Positionsliste (Action-Log: nur der beste Treffer pro exists-Aufruf).
+    Weitere Vorkommen im Frame sind nicht gelabelt, der Frame liefert daher keine Negative.
+    """
+
+
+def _positions(value):
+    """null -> [], [x, y] -> [(x, y)], [[x, y], ...] -> [(x, y), ...]"""
+    if not value:
+        return []
+    if isinstance(value[0], (int, float)):
+        return [(int(value[0]), int(value[1]))]
+    return [(int(p[0]), int(p[1])) for p in value]
+
+
+def load_labels(path=LABELS_FILE):
+    """{frame_pfad: {template_name: [(x, y), ...]}}; leere Liste = Template nicht sichtbar"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+    labels = {}
+    for frame, tpls in data.get("frames", {}).items():
+        frame_path = frame if os.path.isabs(frame) else os.path.join(base, frame)
+        labels[frame_path] = {os.path.basename(t): _positions(v) for t, v in tpls.items()}
+    return labels
+
+
+def labels_from_actions_log(log_dir=ABS_LOG_DIR):
+    """
+    Positive Labels aus den Logs: exists-Treffer, deren Screenshot noch existiert.
+    Nur Vollbild-Screenshots von exists_raw_logged ("exists_…png"); die Flow-Engine
+    überschreibt ihren Screenshot pro Gerät und taugt nicht als Korpus.
+    Positionslisten sind PositivesOnly (Templates wie Empty.png kommen mehrfach vor).
+    """
+    labels = {}
+    if not os.path.isdir(log_dir):
+        return labels
+    for name in sorted(os.listdir(log_dir)):
+        path = os.path.join(log_dir, name, "actions_log.json")
+        if not os.path.exists(path):
+            continue
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"[WARN] {path} übersprungen: {e}")
+            continue
+        for e in entries:
+            shot = (e.get("extra") or {}).get("screenshot")
+            if e.get("action") != "exists" or not e.get("position") or not shot:
+                continue
+            if not os.path.basename(shot).startswith("exists_") or not os.path.exists(shot):
+                continue
+            tpl_name = os.path.basename(str(e.get("template")).replace("\\", "/"))
+            labels.setdefault(shot, {}).setdefault(tpl_name, PositivesOnly()).append(tuple(e["position"]))
+    return labels
+
+
+def merge_labels(*sources):
+    """Vereinigt Positionen; vollständig bleibt ein Label, wenn eine Quelle es vollständig liefert"""
+    merged = {}
+    for src in sources:
+        for frame, tpls in src.items():
+            target = merged.setdefault(frame, {})
+            for name, pos in tpls.items():
+                prev = target.get(name)
+                union = sorted(set(prev or []) | set(pos))
+                partial = isinstance(pos, PositivesOnly) and (prev is None or isinstance(prev, PositivesOnly))
+                target[name] = PositivesOnly(union) if partial else union
+    return merged
+
+
+# ------------------ Scores ------------------
+def collect_scores(templates, labels, scale=1.0, chunk=CHUNK):
+    """
+    Matcht alle Templates über alle gelabelten Frames.
+    Gibt {template_name: {"pos": [...], "neg": [...], "centers": [(x, y, w, h)], "size": (w, h)}} zurück:
+      pos = bester Score im Radius HIT_RADIUS um jedes Label
+      neg = bester Score außerhalb aller Labels (pro Frame), also der gefährlichste Fehltreffer;
+            nur für vollständig gelabelte Frames (nicht für PositivesOnly)
+    """
+    import numpy as np
+    from template_atlas import TemplateAtlas
+
+    atlas = TemplateAtlas(templates, scale)
+    by_name = {os.path.basename(t.filename): t for t in templates}
+    stats = {name: {"pos": [], "neg": [], "centers": []} for name in by_name}
+
+    # Frames gleicher Größe zusammen verarbeiten
+    groups = {}
+    for frame_path, tpls in labels.items():
+        if not any(name in by_name for name in tpls):
+            continue
+        img = load_image_bgr(frame_path)
+        if img is None:
+            print(f"[WARN] Frame nicht lesbar: {frame_path}")
+            continue
+        groups.setdefault(img.shape, []).append((img, tpls))
+
+    for shape, items in groups.items():
+        for i in range(0, len(items), chunk):
+            part = items[i:i + chunk]
+            maps = atlas.score_maps_batch([img for img, _ in part])
+            for name, tpl in by_name.items():
+                stack = maps.get(tpl.filename)
+                if stack is None:
+                    continue
+                w, h = atlas.size(tpl)
+                for k, (_, tpls) in enumerate(part):
+                    if name not in tpls:
+                        continue
+                    res = stack[k]
+                    mask = np.ones(res.shape, bool)
+                    for x, y in tpls[name]:
+                        # Label = Mittelpunkt -> linke obere Ecke im Score-Raster
+                        left, top = x - w // 2, y - h // 2
+                        y1, y2 = max(0, top - HIT_RADIUS), min(res.shape[0], top + HIT_RADIUS + 1)
+                        x1, x2 = max(0, left - HIT_RADIUS), min(res.shape[1], left + HIT_RADIUS + 1)
+                        if y1 >= y2 or x1 >= x2:
+                            continue
+                        stats[name]["pos"].append(float(res[y1:y2, x1:x2].max()))
+                        stats[name]["centers"].append((x, y, shape[1], shape[0]))
+                        # Umgebung eines echten Treffers zählt nicht als Fehltreffer
+                        mask[max(0, top - h // 2):top + h // 2 + 1, max(0, left - w // 2):left + w // 2 + 1] = False
+                    if mask.any() and not isinstance(tpls[name], PositivesOnly):
+                        stats[name]["neg"].append(float(res[mask].max()))
+    for name, tpl in by_name.items():
+        stats[name]["size"] = atlas.size(tpl)
+    return stats
+
+
+# ------------------ Vorschläge ------------------
+def rates(pos, neg, threshold):
+    """(recall, false_positive_rate) bei gegebenem threshold"""
+    recall = sum(p >= threshold for p in pos) / len(pos) if pos else None
+    fp = sum(n >= threshold for n in neg) / len(neg) if neg else None
+    return recall, fp
+
+
+def suggest_threshold(pos, neg, weight=FALSE_TAP_WEIGHT):
+    """
+    Trennbar: Mitte der Lücke zwischen schlechtestem Treffer und bestem Fehltreffer.
+    Sonst: threshold mit minimalen Kosten (verpasst + weight * falsch).
+    """
+    if not pos:
+        return None
+    if not neg:
+        return round(min(pos) - 0.02, 3)
+    lo, hi = min(pos), max(neg)
+    if lo > hi:
+        return round((lo + hi) / 2, 3)
+    best_t, best_cost = None, None
+    for t in sorted(set(pos) | {n + 1e-4 for n in neg}):
+        cost = sum(p < t for p in pos) + weight * sum(n >= t for n in neg)
+        if best_cost is None or cost < best_cost:
+            best_t, best_cost = t, cost
+    return round(best_t, 3)
+
+
+def suggest_roi(centers, size, margin=ROI_MARGIN):
+    """Relativer Suchbereich [x1, y1, x2, y2] (0..1) um alle beobachteten Treffer"""
+    if not centers:
+        return None
+    w, h = size
+    x1 = min((x - w / 2 - margin) / fw for x, _, fw, _ in centers)
+    y1 = min((y - h / 2 - margin) / fh for _, y, _, fh in centers)
+    x2 = max((x + w / 2 + margin) / fw for x, _, fw, _ in centers)
+    y2 = max((y + h / 2 + margin) / fh for _, y, _, fh in centers)
+    return [round(max(0.0, x1), 3), round(max(0.0, y1), 3), round(min(1.0, x2), 3), round(min(1.0, y2), 3)]
+
+
+def calibrate(templates, labels, scale=1.0):
+    stats = collect_scores(templates, labels, scale)
+    report = {}
+    for tpl in templates:
+        name = os.path.basename(tpl.filename)
+        s = stats[name]
+        pos, neg = s["pos"], s["neg"]
+        suggested = suggest_threshold(pos, neg)
+        if suggested is not None and not neg:
+            # ohne Negative (z. B. nur Action-Log) gibt es keinen Grund, den Wert anzuheben
+            suggested = min(suggested, tpl.threshold)
+        cur_recall, cur_fp = rates(pos, neg, tpl.threshold)
+        new_recall, new_fp = rates(pos, neg, suggested) if suggested is not None else (None, None)
+        report[name] = {
+            "samples": {"positive": len(pos), "negative": len(neg)},
+            "current": {"threshold": tpl.threshold, "recall": cur_recall, "false_positive_rate": cur_fp},
+            "suggested": {"threshold": suggested, "recall": new_recall, "false_positive_rate": new_fp},
+            "worst_hit": round(min(pos), 3) if pos else None,
+            "best_false": round(max(neg), 3) if neg else None,
+            "roi": suggest_roi(s["centers"], s["size"]),
+        }
+    return report
+
+
+def _fmt(v, pct=False):
+    if v is None:
+        return "-"
+    return f"{v:.1%}" if pct else f"{v:.3f}"
+
+
+def print_report(report):
+    print("Template                        Pos  Neg   Akt.   Recall  FP     -> Neu    Recall  FP      ROI")
+    for name, r in report.items():
+        cur, new = r["current"], r["suggested"]
+        print(f"{name:<30} {r['samples']['positive']:>4} {r['samples']['negative']:>4}  "
+              f"{_fmt(cur['threshold'])}  {_fmt(cur['recall'], True):>6}  {_fmt(cur['false_positive_rate'], True):>6}"
+              f"  -> {_fmt(new['threshold'])}  {_fmt(new['recall'], True):>6}  {_fmt(new['false_positive_rate'], True):>6}"
+              f"  {r['roi']}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Thresholds und ROIs aus gelabelten Frames vorschlagen")
+    parser.add_argument("--labels", default=LABELS_FILE, help="labels.json")
+    parser.add_argument("--from-actions-log", action="store_true",
+                        help="zusätzlich Treffer aus logs/*/actions_log.json verwenden")
+    parser.add_argument("--scale", type=float, default=1.0, help="Template-Skalierung der Frames")
+    parser.add_argument("--out", default=SUGGESTIONS_FILE)
+    args = parser.parse_args()
+
+    from gardening import ALL_TEMPLATES
+
+    sources = [load_labels(args.labels)]
+    if args.from_actions_log:
+        sources.append(labels_from_actions_log())
+    labels = merge_labels(*sources)
+    if not labels:
+        print(f"[WARN] Keine Labels gefunden ({args.labels})")
+        raise SystemExit(1)
+    print(f"[INFO] {len(labels)} gelabelte Frames")
+    report = calibrate(ALL_TEMPLATES, labels, args.scale)
+    print_report(report)
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"[OK] Vorschläge gespeichert: {args.out}")
@@ -0,0 +1,253 @@
+# -*- encoding: utf-8 -*-
+"""
+device_watchdog.py
+Überwachung der Geräte-Loops (ein Thread pro Emulator).
+Funktionen:
+ - heartbeat() aus gardening_loop und der Flow-Engine: "Loop lebt noch"
+ - Stillstand (kein Heartbeat in der erwarteten Zeit) oder beendeter Thread:
+   hängende adb-Prozesse beenden, Gerät neu verbinden, Loop neu starten
+ - Neustarts mit wachsendem Abstand; dauerhaft tote Emulatoren werden als "dead" gemeldet
+ - Bericht pro Gerät: Status, Verfügbarkeit, Neustarts, Zyklen/h, Pflanzen/h
+"""
+
+import itertools
+import threading
+import time
+
+from raw_airtest_pro import kill_adb_processes, has_backend
+from adb_client import AdbError, get_client
+from position_memo import POSITION_MEMO
+from incremental_matcher import INCREMENTAL
+
+STALL_SECONDS = 120.0     # so lange darf ein Loop ohne Heartbeat sein (zusätzlich zu `expect`)
+CHECK_INTERVAL = 5.0
+REPORT_INTERVAL = 300.0
+HEALTHY_SECONDS = 300.0   # wer so lange lief, gilt beim nächsten Ausfall wieder als gesund
+RESTART_BACKOFF = (5, 30, 120, 600)  # Sekunden bis zum Neustart nach 1., 2., 3., ≥4. Ausfall in Folge
+
+_local = threading.local()
+_active = None
+# Tokens sind prozessweit eindeutig: auch ein nach release() neu angelegter Zustand
+# für dieselbe Adresse bekommt nie das Token eines alten Threads
+_tokens = itertools.count(1)
+
+
+class LoopSuperseded(BaseException):
+    """
+    Wird im alten Thread ausgelöst, wenn der Watchdog dessen Loop bereits ersetzt hat.
+    BaseException, damit die breiten `except Exception` in den Loops ihn nicht abfangen.
+    """
+
+
+class _DeviceState:
+    def __init__(self, device_addr):
+        now = time.time()
+        self.addr = device_addr
+        self.thread = None
+        self.token = None
+        self.status = "starting"
+        self.first_seen = now
+        self.started = now
+        self.last_beat = now
+        self.expect = 0.0
+        self.uptime = 0.0          # abgeschlossene Laufzeiten
+        self.restarts = 0
+        self.failures = 0          # Ausfälle in Folge
+        self.next_start = 0.0
+        self.cycles = 0
+        self.planted = 0
+        self.last_error = None
+
+    def running_for(self, now):
+        return now - self.started if self.status == "running" else 0.0
+
+
+class Watchdog:
+    def __init__(self, target, stall_seconds=STALL_SECONDS, check_interval=CHECK_INTERVAL,
+                 report_interval=REPORT_INTERVAL):
+        """target(device_addr) ist der Geräte-Loop (gardening_loop)"""
+        self.target = target
+        self.stall_seconds = stall_seconds
+        self.check_interval = check_interval
+        self.report_interval = report_interval
+        self._devices = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # ---------- Geräte ----------
+    def supervise(self, device_addr, meta=None):
+        """Loop für ein Gerät starten und überwachen (Signatur passt zu DeviceTracker.on_added)"""
+        with self._lock:
+            st = self._devices.get(device_addr)
+            if st is not None and st.status in ("running", "starting"):
+                return
+            if st is None:
+                st = _DeviceState(device_addr)
+                self._devices[device_addr] = st
+        self._launch(st)
+
+    def release(self, device_addr):
+        """Gerät nicht mehr überwachen; der laufende Loop endet beim nächsten Heartbeat"""
+        with self._lock:
+            st = self._devices.pop(device_addr, None)
+        if st is not None:
+            st.token = next(_tokens)
+            print(f"[INFO] Watchdog: {device_addr} nicht mehr überwacht")
+
+    def _launch(self, st):
+        with self._lock:
+            token = st.token = next(_tokens)
+            now = time.time()
+            st.status = "running"
+            st.started = st.last_beat = now
+            st.expect = 0.0
+            st.thread = threading.Thread(target=self._run, args=(st, token),
+                                         name=f"loop-{st.addr}", daemon=True)
+        st.thread.start()
+
+    def _run(self, st, token):
+        _local.device = (st.addr, token)
+        try:
+            self.target(st.addr)
+            st.last_error = "Loop beendet"
+        except LoopSuperseded:
+            return
+        except Exception as e:
+            st.last_error = str(e)
+            print(f"[WARN][{st.addr}] Loop abgestürzt: {e}")
+
+    # ---------- Aufrufe aus den Loops ----------
+    def heartbeat(self, device_addr, expect=None):
+        st = self._devices.get(device_addr)
+        current = getattr(_local, "device", None)
+        if current is not None and current[0] == device_addr and (st is None or current[1] != st.token):
+            # ersetzt oder nach release() nicht mehr überwacht
+            raise LoopSuperseded(device_addr)
+        if st is None:
+            return
+        st.last_beat = time.time()
+        st.expect = expect or 0.0
+
+    def record_cycle(self, device_addr, planted=0):
+        st = self._devices.get(device_addr)
+        if st is not None:
+            st.cycles += 1
+            st.planted += planted
+
+    # ---------- Überwachung ----------
+    def _fail(self, st, now, reason):
+        """Loop gilt als ausgefallen: Laufzeit verbuchen, Neustart planen"""
+        st.uptime += st.running_for(now)
+        st.failures = 1 if now - st.started >= HEALTHY_SECONDS else st.failures + 1
+        delay = RESTART_BACKOFF[min(st.failures, len(RESTART_BACKOFF)) - 1]
+        st.status = "dead" if st.failures >= len(RESTART_BACKOFF) else "restarting"
+        st.next_start = now + delay
+        st.last_error = reason
+        st.token = next(_tokens)  # alter Thread endet beim nächsten Heartbeat
+        print(f"[WARN][{st.addr}] Watchdog: {reason} – Neustart in {delay}s ({st.status})")
+        threading.Thread(target=self._recover, args=(st,), name=f"recover-{st.addr}", daemon=True).start()
+
+    def _recover(self, st):
+        killed = kill_adb_processes(st.addr)
+        if killed:
+            print(f"[INFO][{st.addr}] Watchdog: {killed} hängende adb-Prozesse beendet")
+        POSITION_MEMO.forget(st.addr)
+        INCREMENTAL.forget(st.addr)
+        if has_backend(st.addr):
+            return
+        client = get_client()
+        client.drop(st.addr)
+        if ":" in st.addr:
+            try:
+                print(f"[INFO][{st.addr}] Watchdog: adb connect: {client.connect_device(st.addr)}")
+            except (OSError, AdbError) as e:
+                print(f"[WARN][{st.addr}] Watchdog: adb connect fehlgeschlagen: {e}")
+
+    def check(self):
+        now = time.time()
+        with self._lock:
+            states = list(self._devices.values())
+        for st in states:
+            if st.status == "running":
+                if not st.thread.is_alive():
+                    self._fail(st, now, st.last_error or "Loop beendet")
+                elif now - st.last_beat > st.expect + self.stall_seconds:
+                    self._fail(st, now, f"kein Heartbeat seit {now - st.last_beat:.0f}s")
+            elif st.status in ("restarting", "dead") and now >= st.next_start:
+                st.restarts += 1
+                self._launch(st)
+
+    def _loop(self):
+        last_report = time.time()
+        while not self._stop.wait(self.check_interval):
+            try:
+                self.check()
+            except Exception as e:
+                print(f"[WARN] Watchdog: {e}")
+            if time.time() - last_report >= self.report_interval:
+                last_report = time.time()
+                self.print_report()
+
+    def start(self):
+        global _active
+        _active = self
+        self._thread = threading.Thread(target=self._loop, name="watchdog", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        global _active
+        self._stop.set()
+        if _active is self:
+            _active = None
+
+    # ---------- Bericht ----------
+    def report(self):
+        """[{device, status, uptime, availability, restarts, cycles_per_hour, planted_per_hour, last_error}]"""
+        now = time.time()
+        with self._lock:
+            states = list(self._devices.values())
+        rows = []
+        for st in sorted(states, key=lambda s: s.addr):
+            uptime = st.uptime + st.running_for(now)
+            hours = max(uptime / 3600.0, 1e-9)
+            rows.append({
+                "device": st.addr,
+                "status": st.status,
+                "uptime": uptime,
+                "availability": uptime / max(now - st.first_seen, 1e-9),
+                "restarts": st.restarts,
+                "cycles_per_hour": st.cycles / hours if uptime >= 60 else None,
+                "planted_per_hour": st.planted / hours if uptime >= 60 else None,
+                "last_error": st.last_error,
+            })
+        return rows
+
+    def print_report(self):
+        rows = self.report()
+        print("Gerät                  Status       Laufzeit  Verfügb.  Neustarts  Zyklen/h  Pflanzen/h")
+        for r in rows:
+            cph = "-" if r["cycles_per_hour"] is None else f"{r['cycles_per_hour']:.1f}"
+            pph = "-" if r["planted_per_hour"] is None else f"{r['planted_per_hour']:.1f}"
+            print(f"{r['device']:<22} {r['status']:<10} {r['uptime'] / 60:>8.1f}m {r['availability']:>8.1%}"
+                  f"  {r['restarts']:>9}  {cph:>8}  {pph:>10}")
+        dead = [r["device"] for r in rows if r["status"] == "dead"]
+        if dead:
+            print(f"[WARN] Dauerhaft ausgefallen: {', '.join(dead)}")
+
+
+# ------------------ Modulfunktionen (no-op ohne laufenden Watchdog) ------------------
+def heartbeat(device_addr, expect=None):
+    """
+    Meldet, dass der Loop für device_addr lebt. expect = Sekunden, die bis zum nächsten
+    Heartbeat bewusst vergehen (z. B. vor einer langen Pause).
+    Löst LoopSuperseded aus, wenn der Watchdog diesen Loop schon ersetzt hat.
+    """
+    if _active is not None:
+        _active.heartbeat(device_addr, expect)
+
+
+def record_cycle(device_addr, planted=0):
+    if _active is not None:
+        _active.record_cycle(device_addr, planted)
@@ -1,12 +1,10 @@
 import csv
 from pathlib import Path
 
-def get_active_emulators(csv_path: str | Path = "Emu.csv") -> list[str]:
+def load_emulator_table(csv_path: str | Path = "Emu.csv") -> dict[str, dict]:
     """
-    Liest Emu.csv und gibt eine Liste der Emulator-Adressen zurück,
-    bei denen das Flag 'x' gesetzt ist.
-
-    Erkennt das Trennzeichen automatisch und ignoriert leere Zeilen.
+    Liest Emu.csv und gibt alle Zeilen als {Adresse: Metadaten} zurück.
+    Metadaten: {"active": bool, "emu": str, "user": str}
     """
     csv_path = Path(csv_path)
     if not csv_path.exists():
@@ -22,20 +20,30 @@ def get_active_emulators(csv_path: str | Path = "Emu.csv") -> list[str]:
             dialect = csv.excel
             dialect.delimiter = ","
 
-        reader = csv.DictReader(f, dialect=dialect)
-
-        active_addrs = []
-        for row in reader:
+        table = {}
+        for row in csv.DictReader(f, dialect=dialect):
             if not row:
                 continue  # leere Zeilen überspringen
+            addr = str(row.get("Emu-Adress", "")).strip()
+            if not addr:
+                continue
+            table[addr] = {
+                "active": str(row.get("Flag", "")).strip().lower() == "x",
+                "emu": str(row.get("Emu", "") or "").strip(),
+                "user": str(row.get("User", "") or "").strip(),
+            }
+    return table
 
-            flag = str(row.get("Flag", "")).strip().lower()
-            if flag == "x":
-                addr = str(row.get("Emu-Adress", "")).strip()
-                if addr:
-                    active_addrs.append(addr)
 
-    return active_addrs
+def get_active_emulators(csv_path: str | Path = "Emu.csv") -> list[str]:
+    """
+    Liest Emu.csv und gibt eine Liste der Emulator-Adressen zurück,
+    bei denen das Flag 'x' gesetzt ist.
+
+    Erkennt das Trennzeichen automatisch und ignoriert leere Zeilen.
+    """
+    table = load_emulator_table(csv_path)
+    return [addr for addr, meta in table.items() if meta["active"]]
 
 
 # Nur zu Testzwecken (direkt ausführbar)
@@ -0,0 +1,429 @@
+# -*- encoding: utf-8 -*-
+"""
+fake_adb.py
+Offline-Simulator für raw_airtest_pro (kein Emulator, kein adb nötig).
+Funktionen:
+ - FakeAdbDevice implementiert adb_exec()/screencap() wie ein echtes Gerät
+ - Spielt aufgezeichnete Frames aus logs/ ab
+ - Reagiert auf tap/swipe anhand eines Screen-Graphen (JSON oder actions_log.json)
+ - Latenz-Injektion für screencap / shell-Befehle
+ - FakeAdbServer: lokaler Stand-in für den adb-Server (Wire-Protokoll auf einem Port)
+ - simulate_farm(): gardening_loop mit N virtuellen Emulatoren (Lasttest)
+
+Screen-Graph (JSON):
+{
+  "start": "garden",
+  "screens": {
+    "garden": {"frame": "logs/garden.png",
+               "taps":   [{"rect": [x1, y1, x2, y2], "to": "seeds"}],
+               "swipes": [{"rect": [x1, y1, x2, y2], "to": "garden"}],
+               "after":  {"seconds": 2.0, "to": "garden"}},
+    ...
+  }
+}
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import random
+import shlex
+import socket
+import threading
+import subprocess
+
+sys.path.append(os.path.dirname(__file__))
+
+import raw_airtest_pro
+from raw_airtest_pro import ABS_LOG_DIR, register_backend, unregister_backend
+from adb_client import read_block
+
+TAP_RADIUS = 40          # Tap-Bereich um eine aufgezeichnete Position (Pixel)
+DEFAULT_SIZE = (720, 1280)
+DEFAULT_DPI = 320
+STOP_TIMEOUT = 60.0      # Sekunden, die simulate_farm am Ende auf laufende Loops wartet
+
+
+# ------------------ Screen-Graph ------------------
+def _in_rect(pos, rect):
+    x, y = pos
+    x1, y1, x2, y2 = rect
+    return x1 <= x <= x2 and y1 <= y <= y2
+
+
+def _resolve_frame(path, search_dir):
+    """Findet einen Frame lokal wieder (auch bei Windows-Pfaden aus anderen Rechnern)"""
+    if path and os.path.exists(path):
+        return path
+    name = os.path.basename(str(path).replace("\\", "/"))
+    hits = glob.glob(os.path.join(search_dir, "**", name), recursive=True)
+    return hits[0] if hits else None
+
+
+class ScreenGraph:
+    """Unveränderliche Beschreibung der Screens; der Zustand liegt im FakeAdbDevice"""
+
+    def __init__(self, screens, start):
+        if start not in screens:
+            raise ValueError(f"Start-Screen {start} nicht im Graph")
+        self.screens = screens
+        self.start = start
+        self._png = {}
+        for name, screen in screens.items():
+            with open(screen["frame"], "rb") as f:
+                self._png[name] = f.read()
+
+    def png(self, name):
+        return self._png[name]
+
+    def next_screen(self, name, kind, pos):
+        for rule in self.screens[name].get(kind, []):
+            if _in_rect(pos, rule["rect"]):
+                return rule["to"]
+        return name
+
+    @classmethod
+    def from_json(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        base = os.path.dirname(os.path.abspath(path))
+        screens = {}
+        for name, screen in data["screens"].items():
+            screen = dict(screen)
+            frame = screen["frame"]
+            if not os.path.isabs(frame):
+                frame = os.path.join(base, frame)
+            screen["frame"] = frame
+            screens[name] = screen
+        return cls(screens, data["start"])
+
+    @classmethod
+    def from_frames(cls, frame_dir=ABS_LOG_DIR, pattern="*.png"):
+        """Lineare Wiedergabe: jeder Tap/Swipe springt zum nächsten Frame"""
+        frames = sorted(glob.glob(os.path.join(frame_dir, "**", pattern), recursive=True))
+        if not frames:
+            raise FileNotFoundError(f"Keine Frames gefunden in: {frame_dir}")
+        screens = {}
+        everywhere = [0, 0, 10 ** 6, 10 ** 6]
+        for i, frame in enumerate(frames):
+            nxt = f"f{(i + 1) % len(frames)}"
+            screens[f"f{i}"] = {"frame": frame,
+                                "taps": [{"rect": everywhere, "to": nxt}],
+                                "swipes": [{"rect": everywhere, "to": nxt}]}
+        return cls(screens, "f0")
+
+    @classmethod
+    def from_actions_log(cls, log_file, frame_dir=ABS_LOG_DIR):
+        """
+        Baut den Graphen aus einem actions_log.json:
+        jeder Screenshot wird ein Screen, ein Tap/Swipe danach führt zum nächsten Screenshot.
+        """
+        with open(log_file, "r", encoding="utf-8") as f:
+            entries = json.load(f)
+        screens = {}
+        order = []
+        pending = None  # (screen, art, pos) der letzten Eingabe
+        for entry in entries:
+            extra = entry.get("extra") or {}
+            if entry["action"] == "screenshot":
+                frame = _resolve_frame(extra.get("file"), frame_dir)
+                if not frame:
+                    continue
+                name = os.path.basename(frame)
+                if name not in screens:
+                    screens[name] = {"frame": frame, "taps": [], "swipes": []}
+                    order.append(name)
+                if pending:
+                    src, kind, (x, y) = pending
+                    rect = [x - TAP_RADIUS, y - TAP_RADIUS, x + TAP_RADIUS, y + TAP_RADIUS]
+                    screens[src][kind].append({"rect": rect, "to": name})
+                    pending = None
+            elif entry["action"] in ("tap", "swipe") and order:
+                pos = entry.get("position") or extra.get("start")
+                if pos:
+                    pending = (order[-1], entry["action"] + "s", tuple(pos))
+        if not screens:
+            raise FileNotFoundError(f"Keine Frames aus {log_file} lokal gefunden (Suchordner: {frame_dir})")
+        return cls(screens, order[0])
+
+
+# ------------------ Latenz ------------------
+class Latency:
+    """Künstliche adb-Latenz in Sekunden (jitter = relative Schwankung)"""
+
+    def __init__(self, screencap=0.0, shell=0.0, jitter=0.0, seed=None):
+        self.screencap = screencap
+        self.shell = shell
+        self.jitter = jitter
+        self._rng = random.Random(seed)
+
+    def wait(self, base):
+        if base <= 0:
+            return
+        if self.jitter:
+            base *= 1 + self._rng.uniform(-self.jitter, self.jitter)
+        time.sleep(max(0.0, base))
+
+
+# ------------------ Fake-Gerät ------------------
+class FakeAdbDevice:
+    """Verhält sich gegenüber raw_airtest_pro wie ein per adb verbundener Emulator"""
+
+    def __init__(self, device_addr, graph, latency=None, size=DEFAULT_SIZE, dpi=DEFAULT_DPI, time_scale=1.0):
+        self.device_addr = device_addr
+        self.graph = graph
+        self.latency = latency or Latency()
+        self.time_scale = time_scale  # Faktor für Swipe-Dauern (0 = volle Geschwindigkeit)
+        self.size = size
+        self.dpi = dpi
+        self.screen = graph.start
+        self._entered = time.time()
+        self._lock = threading.Lock()
+        self.stats = {"screencap": 0, "tap": 0, "swipe": 0, "shell": 0, "transitions": 0}
+
+    # ---------- Zustandswechsel ----------
+    def _goto(self, name):
+        if name != self.screen:
+            self.screen = name
+            self._entered = time.time()
+            self.stats["transitions"] += 1
+
+    def _advance_timed(self):
+        after = self.graph.screens[self.screen].get("after")
+        if after and time.time() - self._entered >= after["seconds"]:
+            self._goto(after["to"])
+
+    def _input(self, kind, pos):
+        with self._lock:
+            self._advance_timed()
+            self._goto(self.graph.next_screen(self.screen, kind + "s", pos))
+            self.stats[kind] += 1
+
+    # ---------- adb-Oberfläche ----------
+    def screencap(self):
+        self.latency.wait(self.latency.screencap)
+        with self._lock:
+            self._advance_timed()
+            self.stats["screencap"] += 1
+            return self.graph.png(self.screen)
+
+    def adb_exec(self, cmd, text=True):
+        self.latency.wait(self.latency.shell)
+        args = [str(c) for c in cmd]
+        out = ""
+        if args[:3] == ["shell", "input", "tap"]:
+            self._input("tap", (int(float(args[3])), int(float(args[4]))))
+        elif args[:3] == ["shell", "input", "swipe"]:
+            self._input("swipe", (int(float(args[3])), int(float(args[4]))))
+            if len(args) > 7:
+                time.sleep(int(args[7]) / 1000.0 * self.time_scale)
+        elif args[:3] == ["shell", "wm", "size"]:
+            out = f"Physical size: {self.size[0]}x{self.size[1]}\n"
+        elif args[:3] == ["shell", "wm", "density"]:
+            out = f"Physical density: {self.dpi}\n"
+        elif args[:3] == ["exec-out", "screencap", "-p"]:
+            data = self.screencap()
+            return subprocess.CompletedProcess(["adb", "-s", self.device_addr] + args, 0,
+                                               stdout=data if not text else data.decode("latin-1"), stderr="")
+        with self._lock:
+            self.stats["shell"] += 1
+        return subprocess.CompletedProcess(["adb", "-s", self.device_addr] + args, 0,
+                                           stdout=out if text else out.encode(), stderr="")
+
+
+def attach_fake_devices(graph, count, latency=None, prefix="fake", time_scale=1.0):
+    """Registriert `count` virtuelle Emulatoren und gibt deren Adressen zurück"""
+    addrs = []
+    for i in range(count):
+        addr = f"{prefix}-{i:03d}"
+        lat = Latency(latency.screencap, latency.shell, latency.jitter, seed=i) if latency else None
+        register_backend(addr, FakeAdbDevice(addr, graph, lat, time_scale=time_scale))
+        addrs.append(addr)
+    return addrs
+
+
+def detach_fake_devices(addrs):
+    for addr in addrs:
+        unregister_backend(addr)
+
+
+# ------------------ Stand-in adb-Server ------------------
+class FakeAdbServer:
+    """
+    Spricht das adb-Server-Protokoll auf einem lokalen Port, Geräte sind FakeAdbDevice.
+    Damit laufen adb_client, DeviceTracker und raw_airtest_pro (USE_ADB_SOCKET)
+    ohne echten adb-Server. Unterstützt host:version/devices/track-devices/connect/
+    transport sowie shell: und exec:.
+    """
+
+    def __init__(self, devices=None, host="127.0.0.1", port=0):
+        self.devices = dict(devices or {})
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((host, port))
+        self._sock.listen(64)
+        self.host, self.port = self._sock.getsockname()[:2]
+        self._running = False
+
+    # ---------- Geräteverwaltung ----------
+    def add_device(self, device):
+        with self._changed:
+            self.devices[device.device_addr] = device
+            self._changed.notify_all()
+
+    def remove_device(self, device_addr):
+        with self._changed:
+            self.devices.pop(device_addr, None)
+            self._changed.notify_all()
+
+    def _device_list(self):
+        return "".join(f"{addr}\tdevice\n" for addr in self.devices).encode()
+
+    # ---------- Protokoll ----------
+    @staticmethod
+    def _okay(conn, payload=None):
+        conn.sendall(b"OKAY")
+        if payload is not None:
+            conn.sendall(f"{len(payload):04x}".encode() + payload)
+
+    @staticmethod
+    def _fail(conn, msg):
+        data = msg.encode()
+        conn.sendall(b"FAIL" + f"{len(data):04x}".encode() + data)
+
+    def _track(self, conn):
+        with self._changed:
+            last = self._device_list()
+        self._okay(conn, last)
+        while self._running:
+            with self._changed:
+                self._changed.wait(0.5)
+                current = self._device_list()
+            if current != last:
+                conn.sendall(f"{len(current):04x}".encode() + current)
+                last = current
+
+    def _handle(self, conn):
+        device = None
+        with conn:
+            try:
+                while True:
+                    req = read_block(conn).decode("utf-8", "replace")
+                    if req == "host:version":
+                        self._okay(conn, b"0029")
+                    elif req in ("host:devices", "host:devices-l"):
+                        with self._lock:
+                            self._okay(conn, self._device_list())
+                    elif req == "host:track-devices":
+                        self._track(conn)
+                    elif req.startswith("host:connect:"):
+                        self._okay(conn, f"connected to {req[len('host:connect:'):]}".encode())
+                    elif req.startswith("host:transport:"):
+                        with self._lock:
+                            device = self.devices.get(req[len("host:transport:"):])
+                        if device is None:
+                            self._fail(conn, "device not found")
+                            return
+                        conn.sendall(b"OKAY")
+                        continue
+                    elif device is not None and req.startswith("shell:"):
+                        out = device.adb_exec(["shell"] + shlex.split(req[len("shell:"):]), text=False)
+                        conn.sendall(b"OKAY" + out.stdout)
+                    elif device is not None and req.startswith("exec:"):
+                        out = device.adb_exec(["exec-out"] + shlex.split(req[len("exec:"):]), text=False)
+                        conn.sendall(b"OKAY" + out.stdout)
+                    else:
+                        self._fail(conn, f"unknown request: {req}")
+                    return
+            except (OSError, ValueError):
+                return
+
+    def _serve(self):
+        while self._running:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                break
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def start(self):
+        self._running = True
+        threading.Thread(target=self._serve, name="fake-adb-server", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._running = False
+        with self._changed:
+            self._changed.notify_all()
+        self._sock.close()
+
+
+# ------------------ Lasttest ------------------
+def simulate_farm(graph, count=50, duration=60.0, latency=None, pause_seconds=0.0, time_scale=0.0):
+    """
+    Lässt gardening_loop auf `count` virtuellen Emulatoren `duration` Sekunden laufen
+    und gibt die summierten Gerätestatistiken zurück.
+    pause_seconds ersetzt die 100 s Pause / 60 s Back-off, time_scale skaliert Swipe-Dauern.
+    """
+    import gardening
+
+    gardening.LIVE_DEBUG = False
+    gardening.PAUSE_SECONDS = pause_seconds
+    gardening.FAIL_BACKOFF_SECONDS = pause_seconds
+
+    addrs = attach_fake_devices(graph, count, latency, time_scale=time_scale)
+    stop = threading.Event()
+    loops = [threading.Thread(target=gardening.gardening_loop, args=(addr, stop), name=f"loop-{addr}",
+                              daemon=True) for addr in addrs]
+    start = time.time()
+    for t in loops:
+        t.start()
+    time.sleep(duration)
+    elapsed = time.time() - start
+
+    totals = {}
+    for addr in addrs:
+        for k, v in raw_airtest_pro._BACKENDS[addr].stats.items():
+            totals[k] = totals.get(k, 0) + v
+    # Loops erst beenden, dann Backends abmelden: sonst ginge der laufende Schritt an echtes adb
+    stop.set()
+    deadline = time.time() + STOP_TIMEOUT
+    for t in loops:
+        t.join(max(0.0, deadline - time.time()))
+    running = [t.name for t in loops if t.is_alive()]
+    if running:
+        print(f"[WARN] {len(running)} Loops nach {STOP_TIMEOUT:.0f}s nicht beendet, Backends bleiben registriert")
+        detach_fake_devices([a for a in addrs if f"loop-{a}" not in running])
+    else:
+        detach_fake_devices(addrs)
+    print(f"[SIM] {count} Emulatoren, {elapsed:.1f}s: " +
+          ", ".join(f"{k}={v} ({v / elapsed:.1f}/s)" for k, v in totals.items()))
+    return totals
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="gardening_loop gegen virtuelle Emulatoren laufen lassen")
+    parser.add_argument("--graph", help="Screen-Graph als JSON")
+    parser.add_argument("--actions-log", help="Graph aus actions_log.json ableiten")
+    parser.add_argument("--frames", default=ABS_LOG_DIR, help="Ordner mit aufgezeichneten Frames")
+    parser.add_argument("--devices", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=60.0)
+    parser.add_argument("--screencap-latency", type=float, default=0.0)
+    parser.add_argument("--shell-latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    args = parser.parse_args()
+
+    if args.graph:
+        g = ScreenGraph.from_json(args.graph)
+    elif args.actions_log:
+        g = ScreenGraph.from_actions_log(args.actions_log, args.frames)
+    else:
+        g = ScreenGraph.from_frames(args.frames)
+    simulate_farm(g, args.devices, args.duration,
+                  Latency(args.screencap_latency, args.shell_latency, args.jitter))
@@ -0,0 +1,343 @@
+# -*- encoding: utf-8 -*-
+"""
+flow_engine.py
+Deklarative Abläufe (Screens + Übergänge) für raw_airtest_pro.
+Funktionen:
+ - Flow = benannte States; jeder State sucht (optional) ein Template und
+   verzweigt bei Treffer nach `next`, sonst nach `on_missing`
+ - Eingaben (tap/swipe) laufen in einer Queue pro Gerät; der Flow-Thread
+   loggt und plant währenddessen weiter. Screenshots überlappen bewusst NICHT
+   mit Eingaben: capture() wartet auf alle Eingaben plus Settle-Zeit (gerechnet
+   ab dem Ende der letzten Eingabe), sonst zeigt das Bild noch den alten Screen
+ - Prefetch: pro Screenshot werden die Templates des aktuellen UND der
+   wahrscheinlichen Folge-States in einem Atlas-Durchlauf gesucht; ohne
+   Eingabe dazwischen nutzt der Folge-State dieses Ergebnis direkt
+ - Priorität (admission): Flow.priority, bzw. REWARD, solange ein Belohnungs-Icon
+   (Flow.reward) im letzten Screenshot zu sehen ist; jede Eingabe behält die
+   Priorität vom Zeitpunkt des Einreihens
+"""
+
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from raw_airtest_pro import raw_screenshot, load_image_bgr, tap, swipe
+from position_memo import POSITION_MEMO
+from template_variants import device_scale, template_variant
+from raw_airtest_pro_logging import log_action
+from device_watchdog import heartbeat
+from admission import MATCHING, NORMAL, REWARD, admit, polling, priority_of, set_priority
+import incremental_matcher
+from incremental_matcher import INCREMENTAL
+
+DONE = "done"
+FAIL = "fail"
+
+POLL_INTERVAL = 0.2     # Pause zwischen zwei Screenshots beim Warten auf ein Template
+FRAME_MAX_AGE = 1.0     # so lange (s) darf ein Prefetch-Ergebnis ohne Eingabe wiederverwendet werden
+MAX_STEPS = 200         # Schutz gegen Endlosschleifen in fehlerhaften Flows
+
+
+def _sleep(seconds):
+    # eigene Zeile mit sleep(: der Profiler ordnet Pausen in der Eingabe-Queue so "sleep" zu
+    time.sleep(seconds)
+
+
+# ------------------ Definition ------------------
+class State:
+    """
+    Ein Screen im Ablauf.
+    detect:     Template, das gesucht wird (None = reiner Aktions-State)
+    on_found:   callable(ctx, pos) bei Treffer (bzw. callable(ctx) ohne detect)
+    next:       Folge-State nach Treffer / Aktion
+    on_missing: Folge-State, wenn detect bis timeout nicht gefunden wurde
+    settle:     Wartezeit nach der Eingabe dieses States bis zum nächsten Screenshot
+    max_visits: nach so vielen Besuchen geht es direkt nach on_missing
+    """
+
+    def __init__(self, name, detect=None, on_found=None, next=DONE, on_missing=FAIL,
+                 timeout=2.0, settle=0.0, max_visits=None):
+        self.name = name
+        self.detect = detect
+        self.on_found = on_found
+        self.next = next
+        self.on_missing = on_missing
+        self.timeout = timeout
+        self.settle = settle
+        self.max_visits = max_visits
+
+
+class Flow:
+    """
+    priority: Vorrang bei Screenshots/Matching/Eingaben (admission)
+    reward:   Templates, deren Treffer im Screenshot das Gerät auf REWARD heben
+              (z. B. Ernte-Icons); nur in Screenshots gesucht, die sie ohnehin prüfen
+    """
+
+    def __init__(self, name, states, start, priority=NORMAL, reward=()):
+        self.name = name
+        self.states = {s.name: s for s in states}
+        self.start = start
+        self.priority = priority
+        self.reward = tuple(reward)
+        self._atlas_templates = {}
+        for s in states:
+            for target in (s.next, s.on_missing):
+                if target not in (DONE, FAIL) and target not in self.states:
+                    raise ValueError(f"Flow {name}: State {s.name} verweist auf unbekannten State {target}")
+
+    def templates_for(self, state):
+        """Templates des States plus die der direkten Folge-States (Prefetch)"""
+        tpls = self._atlas_templates.get(state.name)
+        if tpls is None:
+            tpls = []
+            for name in (state.name, state.next, state.on_missing):
+                s = self.states.get(name)
+                if s is not None and s.detect is not None and s.detect not in tpls:
+                    tpls.append(s.detect)
+            self._atlas_templates[state.name] = tpls
+        return tpls
+
+
+# ------------------ Laufzeit-Kontext ------------------
+class FlowContext:
+    """Zustand eines laufenden Flows auf einem Emulator"""
+
+    def __init__(self, device_addr, viewport=None):
+        self.device_addr = device_addr
+        self.viewport = viewport
+        self.vars = {}
+        self.scale = device_scale(device_addr)
+        # Thread-Name mit Gerät: Zuordnung im Profiler (sampling_profiler)
+        self._input_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"input-{device_addr}")
+        self._pending_input = None
+        self._ready_at = 0.0
+        self._input_seq = 0
+        self._frame = None  # (input_seq, zeit, matches, screenshot)
+        self._lock = threading.Lock()
+        safe_addr = str(device_addr).replace(":", "_")
+        self._screen_name = f"flow_{safe_addr}.png"
+
+    # ---------- Eingaben ----------
+    def _submit_input(self, fn, *args, is_input=True):
+        """Hängt fn an die Eingabe-Queue (läuft nach allen offenen Eingaben)"""
+        with self._lock:
+            prev = self._pending_input
+
+            def run():
+                if prev is not None:
+                    prev.result()
+                fn(*args)
+
+            self._pending_input = self._input_pool.submit(run)
+            if is_input:
+                self._input_seq += 1
+
+    def tap(self, pos):
+        self._submit_input(tap, self.device_addr, pos, priority_of(self.device_addr))
+        log_action("tap", position=pos, extra={"device": self.device_addr, "flow": True},
+                   device_addr=self.device_addr)
+
+    def swipe(self, start, end, duration=0.5):
+        self._submit_input(swipe, self.device_addr, start, end, duration, priority_of(self.device_addr))
+        log_action("swipe", extra={"start": start, "end": end, "duration": duration,
+                                   "device": self.device_addr, "flow": True},
+                   device_addr=self.device_addr)
+
+    def pause(self, seconds):
+        """Pause zwischen zwei Eingaben (wird in die Eingabe-Queue eingereiht)"""
+        self._submit_input(_sleep, seconds)
+
+    def settle(self, seconds):
+        """
+        Nächster Screenshot frühestens `seconds` nach dem Ende der zuletzt eingereihten
+        Eingabe (wie das sleep nach der Eingabe im alten Ablauf). Blockiert weder den
+        Aufrufer noch weitere Eingaben.
+        """
+        if seconds <= 0:
+            return
+        pending = self._pending_input
+        if pending is None or pending.done():
+            self._settle_from_now(seconds)
+        else:
+            self._submit_input(self._settle_from_now, seconds, is_input=False)
+
+    def _settle_from_now(self, seconds):
+        self._ready_at = max(self._ready_at, time.time() + seconds)
+
+    def drain(self):
+        """Wartet auf alle offenen Eingaben und die Settle-Zeit"""
+        if self._pending_input is not None:
+            self._pending_input.result()
+        delay = self._ready_at - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+    # ---------- Screenshot + Matching ----------
+    def capture(self, tpls):
+        """Screenshot nach drain() + Matching: (input_seq, zeit, matches, pfad)"""
+        self.drain()
+        seq = self._input_seq
+        path, vp = raw_screenshot(self.device_addr, self._screen_name, crop=True, viewport=self.viewport)
+        if vp and self.viewport is None:
+            self.viewport = vp  # Viewport einmal schätzen, danach wiederverwenden
+        screen = load_image_bgr(path)
+        matches = {}
+        if screen is not None:
+            matches = self._match(screen, tpls, vp)
+        return seq, time.time(), matches, path
+
+    def _match(self, screen, tpls, vp):
+        """Memo-Prüfung + Atlas für tpls; Trefferpositionen in Bildschirmkoordinaten"""
+        left, top = (vp[0], vp[1]) if vp else (0, 0)
+        found = {}
+        remaining = []
+        # Zuerst letzte bekannte Positionen prüfen, nur der Rest wird voll gesucht
+        for tpl in tpls:
+            tpl_img = template_variant(tpl.filename, self.scale)
+            m = POSITION_MEMO.lookup(self.device_addr, tpl, screen, tpl_img) if tpl_img is not None else None
+            if m:
+                found[tpl.filename] = m
+            else:
+                remaining.append(tpl)
+        if remaining:
+            if incremental_matcher.ENABLED:
+                # Score-Karten pro Gerät nachführen (nur geänderte Kacheln); immer das ganze
+                # Set, damit Memo-Treffer den Cache-Eintrag nicht wechseln
+                full = INCREMENTAL.match(self.device_addr, tpls, screen, self.scale)
+            else:
+                from template_atlas import compile_templates  # OpenCV/numpy erst beim ersten Matching
+                with admit(MATCHING, self.device_addr):
+                    full = compile_templates(remaining, self.scale).match_all(screen)
+            for tpl in remaining:
+                m = full.get(tpl.filename)
+                found[tpl.filename] = m
+                if m:
+                    POSITION_MEMO.store(self.device_addr, tpl, m, template_variant(tpl.filename, self.scale))
+        matches = {}
+        for name, m in found.items():
+            if m:
+                x, y = m["result"]
+                m = {"result": (int(x + left), int(y + top)), "confidence": m["confidence"]}
+            matches[name] = m
+        return matches
+
+    def cached_match(self, tpl):
+        """Prefetch-Treffer aus dem letzten Frame, falls seitdem keine Eingabe erfolgte"""
+        frame = self._frame
+        if frame is None:
+            return None
+        seq, ts, matches, _ = frame
+        if seq != self._input_seq or time.time() - ts > FRAME_MAX_AGE:
+            return None
+        return matches.get(tpl.filename)
+
+    def close(self):
+        """Wartet auf offene Eingaben (Fehler daraus werden weitergereicht) und beendet den input-Thread"""
+        try:
+            self.drain()
+        finally:
+            self._input_pool.shutdown(wait=True)
+
+
+# ------------------ Ausführung ------------------
+def _track_reward(ctx, flow, matches):
+    """Belohnungs-Icon im Screenshot -> REWARD, sonst wieder die Flow-Priorität"""
+    checked = [tpl for tpl in flow.reward if tpl.filename in matches]
+    if checked:
+        seen = any(matches[tpl.filename] for tpl in checked)
+        set_priority(ctx.device_addr, REWARD if seen else flow.priority)
+
+
+def _wait_for(ctx, flow, state):
+    tpl = state.detect
+    hit = ctx.cached_match(tpl)
+    if hit:
+        log_action("exists", template_name=tpl.filename, position=hit["result"],
+                   confidence=hit["confidence"], extra={"prefetch": True}, device_addr=ctx.device_addr)
+        return hit["result"]
+
+    tpls = flow.templates_for(state)
+    start = time.time()
+    attempt = 0
+    while True:
+        with polling(ctx.device_addr, attempt):
+            ctx._frame = ctx.capture(tpls)
+        _track_reward(ctx, flow, ctx._frame[2])
+        attempt += 1
+        m = ctx._frame[2].get(tpl.filename)
+        if m:
+            log_action("exists", template_name=tpl.filename, position=m["result"],
+                       confidence=m["confidence"], extra={"screenshot": ctx._frame[3]},
+                       device_addr=ctx.device_addr)
+            return m["result"]
+        if time.time() - start >= state.timeout:
+            break
+        ctx.settle(POLL_INTERVAL)
+    log_action("exists", template_name=tpl.filename, position=None, confidence=None, device_addr=ctx.device_addr)
+    return None
+
+
+def run_flow(flow, device_addr, viewport=None, ctx_vars=None):
+    """
+    Führt einen Flow auf einem Emulator aus.
+    Gibt (erfolg, vars) zurück; erfolg = True, wenn der Flow in DONE endet.
+    """
+    ctx = FlowContext(device_addr, viewport)
+    if ctx_vars:
+        ctx.vars.update(ctx_vars)
+    visits = {}
+    current = flow.start
+    prev_priority = set_priority(device_addr, flow.priority)
+    try:
+        for _ in range(MAX_STEPS):
+            if current in (DONE, FAIL):
+                break
+            heartbeat(device_addr)
+            state = flow.states[current]
+            visits[current] = visits.get(current, 0) + 1
+            if state.max_visits is not None and visits[current] > state.max_visits:
+                current = state.on_missing
+                continue
+
+            if state.detect is None:
+                if state.on_found:
+                    state.on_found(ctx)
+                ctx.settle(state.settle)
+                current = state.next
+                continue
+
+            pos = _wait_for(ctx, flow, state)
+            if pos is None:
+                current = state.on_missing
+                continue
+            if state.on_found:
+                state.on_found(ctx, pos)
+            ctx.settle(state.settle)
+            current = state.next
+        else:
+            print(f"[WARN][{device_addr}] Flow {flow.name}: MAX_STEPS erreicht")
+            current = FAIL
+    finally:
+        try:
+            ctx.close()
+        finally:
+            set_priority(device_addr, prev_priority)
+    return current == DONE, ctx.vars
+
+
+# ------------------ Bausteine für on_found ------------------
+def remember(key):
+    """Speichert die Trefferposition unter ctx.vars[key]"""
+    def _fn(ctx, pos):
+        ctx.vars[key] = pos
+    return _fn
+
+
+def tap_found(key=None):
+    """Tippt auf die Trefferposition (und merkt sie sich optional)"""
+    def _fn(ctx, pos):
+        if key:
+            ctx.vars[key] = pos
+        ctx.tap(pos)
+    return _fn
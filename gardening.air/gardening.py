@@ -8,14 +8,15 @@ import threading
 
 sys.path.append(os.path.dirname(__file__))
 
-from raw_airtest_pro import ABS_LOG_DIR
-from raw_airtest_pro_logging import (
-    tap_logged, swipe_logged, drag_seed_logged, refill_logged, exists_raw_logged, generate_html_report
-)
-from raw_airtest_pro_debug import show_live_debug, close_debug_window
+# Nur leichte Module beim Import; Airtest, OpenCV und das Debug-Fenster werden erst bei Bedarf geladen
+from raw_airtest_pro import ABS_LOG_DIR, init_log_dir, has_backend
+from raw_airtest_pro_logging import generate_html_report, log_action
+from flow_engine import Flow, State, DONE, FAIL, run_flow, remember, tap_found
 from emulator_loader import get_active_emulators
-from airtest.core.api import connect_device
-from airtest.core.cv import Template
+from adb_discovery import DeviceTracker, ensure_adb_server
+from device_watchdog import Watchdog, heartbeat, record_cycle
+from template_variants import preload_variants
+from template_spec import Template
 
 # ------------------ Templates ------------------
 TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "img")
@@ -33,81 +34,137 @@ WATER_BTN         = Template(os.path.join(TEMPLATE_DIR, "GiesKanne.png"), thresh
 DO_CUT            = Template(os.path.join(TEMPLATE_DIR, "1738602489796.png"), threshold=0.70, rgb=True)
 DO_PIK            = Template(os.path.join(TEMPLATE_DIR, "PickUp.png"), threshold=0.70, rgb=True, target_pos=1)
 
+ALL_TEMPLATES = [FREE_PLACE, EMPTY_POT, WHITE_SEED, RED_SEED, EMPTY_WHITE_SEED, EMPTY_RED_SEED,
+                 PLUS_SIGN, GREEN_BUTTON, WATER_BTN, DO_CUT, DO_PIK]
+
 MAX_FAILS = 3
+FAIL_BACKOFF_SECONDS = 60
+PAUSE_SECONDS = 100
+LIVE_DEBUG = True
+
+# ------------------ Flows ------------------
+def _drag_seed_to_pot(ctx, pot_pos):
+    # Drag Seed -> EMPTY_POT, danach zurück zu FREE_PLACE
+    ctx.swipe(ctx.vars["seed"], pot_pos, duration=1)
+    ctx.pause(1)
+    ctx.swipe(pot_pos, ctx.vars["free"], duration=1)
+    ctx.vars["planted"] = ctx.vars["seed_name"]
+
+
+def _remember_seed(seed_tpl):
+    def _fn(ctx, pos):
+        ctx.vars["seed"] = pos
+        ctx.vars["seed_name"] = seed_tpl.filename
+    return _fn
+
+
+def _seed_states(prefix, seed_tpl, refill_tpl, fallback):
+    """States für einen Seed-Typ inkl. Nachfüllen; fallback = nächster Seed"""
+    return [
+        State(f"{prefix}_seed", detect=seed_tpl, on_found=_remember_seed(seed_tpl),
+              next=f"{prefix}_open", on_missing=f"{prefix}_refill"),
+        # Nachfüllen, falls Seed fehlt
+        State(f"{prefix}_refill", detect=refill_tpl, on_found=tap_found(),
+              next=f"{prefix}_plus", on_missing=fallback),
+        State(f"{prefix}_plus", detect=PLUS_SIGN, on_found=tap_found(), timeout=0.5,
+              next=f"{prefix}_plus", on_missing=f"{prefix}_confirm", max_visits=10),
+        State(f"{prefix}_confirm", detect=GREEN_BUTTON, on_found=tap_found(), settle=1,
+              next=f"{prefix}_seed_again", on_missing=fallback),
+        State(f"{prefix}_seed_again", detect=seed_tpl, on_found=_remember_seed(seed_tpl),
+              next=f"{prefix}_open", on_missing=fallback),
+        # Klick auf FREE_PLACE, warten bis Seeds sichtbar werden
+        State(f"{prefix}_open", on_found=lambda ctx: ctx.tap(ctx.vars["free"]), settle=2,
+              next=f"{prefix}_pot"),
+        State(f"{prefix}_pot", detect=EMPTY_POT, on_found=_drag_seed_to_pot, settle=0.5,
+              next=DONE, on_missing=fallback),
+    ]
+
+
+PLANT_FLOW = Flow("plant", [
+    State("free", detect=FREE_PLACE, on_found=remember("free"), next="white_seed", on_missing=FAIL),
+    *_seed_states("white", WHITE_SEED, EMPTY_WHITE_SEED, fallback="red_seed"),
+    *_seed_states("red", RED_SEED, EMPTY_RED_SEED, fallback=FAIL),
+], start="free")
+
+
+def _drag_to_slot(counter):
+    def _fn(ctx, pos):
+        ctx.swipe(pos, ctx.vars["slot"], duration=0.5)
+        ctx.vars[counter] = ctx.vars.get(counter, 0) + 1
+    return _fn
+
+
+def _start_watering(ctx, pos):
+    print(f"[{ctx.device_addr}] Bewässerung gestartet.")
+    ctx.tap(pos)
+
+
+WATER_FLOW = Flow("water_cut_pick", [
+    State("water", detect=WATER_BTN, on_found=_start_watering, timeout=1, settle=2,
+          next="cut_slot", on_missing="cut_slot"),
+    # Schneiden & Aufsammeln
+    State("cut_slot", detect=FREE_PLACE, on_found=remember("slot"), next="cut", on_missing="pik_slot"),
+    State("cut", detect=DO_CUT, on_found=_drag_to_slot("cut"), next="pik_slot", on_missing="pik_slot"),
+    State("pik_slot", detect=FREE_PLACE, on_found=remember("slot"), next="pik", on_missing=DONE),
+    State("pik", detect=DO_PIK, on_found=_drag_to_slot("pik"), next=DONE, on_missing=DONE),
+], start="water", reward=(DO_CUT, DO_PIK))  # Ernte-Icon sichtbar: Vorrang vor dem Polling anderer Emulatoren
+
 
 # ------------------ Helper-Funktionen ------------------
 def plant_one(device_addr):
     """
-    Pflanzt einen Seed auf einem freien Platz:
+    Pflanzt einen Seed auf einem freien Platz (PLANT_FLOW):
     - Klick auf FREE_PLACE
     - Warte 2 Sekunden, bis Seeds sichtbar sind
     - Drag von Seed zu EMPTY_POT (1 Sekunde)
     - Drag zurück zu FREE_PLACE (1 Sekunde)
     """
-    free_pos = exists_raw_logged(FREE_PLACE, device_addr=device_addr)
-    if not free_pos:
+    ok, flow_vars = run_flow(PLANT_FLOW, device_addr)
+    if ok:
+        print(f"[{device_addr}] Seed {flow_vars['planted']} gepflanzt.")
+    elif "free" not in flow_vars:
         print(f"[{device_addr}] Kein freier Platz gefunden.")
-        return False
-
-    for seed_tpl in [WHITE_SEED, RED_SEED]:
-        seed_pos = exists_raw_logged(seed_tpl, device_addr=device_addr)
-        if not seed_pos:
-            # Nachfüllen, falls Seed fehlt
-            refill_tpl = EMPTY_WHITE_SEED if seed_tpl == WHITE_SEED else EMPTY_RED_SEED
-            if refill_logged(refill_tpl, PLUS_SIGN, GREEN_BUTTON, device_addr=device_addr):
-                seed_pos = exists_raw_logged(seed_tpl, device_addr=device_addr)
-            if not seed_pos:
-                continue  # nächster Seed
-
-        # 1️⃣ Klick auf FREE_PLACE
-        tap_logged(free_pos, device_addr=device_addr)
-        time.sleep(2)  # Warte, bis Seeds sichtbar werden
-
-        # 2️⃣ Drag Seed -> EMPTY_POT
-        pot_pos = exists_raw_logged(EMPTY_POT, device_addr=device_addr)
-        if pot_pos:
-            swipe_logged(seed_pos, pot_pos, duration=1, device_addr=device_addr)
-            time.sleep(1)
-
-            # 3️⃣ Drag zurück zu FREE_PLACE
-            swipe_logged(pot_pos, free_pos, duration=1, device_addr=device_addr)
-            time.sleep(0.5)
-            print(f"[{device_addr}] Seed {seed_tpl.filename} gepflanzt.")
-            return True
-
-    print(f"[{device_addr}] Keine Seeds verfügbar.")
-    return False
+    else:
+        print(f"[{device_addr}] Keine Seeds verfügbar.")
+    return ok
 
 def water_cut_pick(device_addr):
-    btn = exists_raw_logged(WATER_BTN, timeout=1, device_addr=device_addr)
-    if btn:
-        print(f"[{device_addr}] Bewässerung gestartet.")
-        tap_logged(btn, device_addr=device_addr)
-        time.sleep(2)
-
-    # Schneiden & Aufsammeln
-    cut_hits = drag_seed_logged([DO_CUT], FREE_PLACE, device_addr=device_addr)
-    pik_hits = drag_seed_logged([DO_PIK], FREE_PLACE, device_addr=device_addr)
+    _, flow_vars = run_flow(WATER_FLOW, device_addr)
+    cut_hits = flow_vars.get("cut", 0)
+    pik_hits = flow_vars.get("pik", 0)
     print(f"[{device_addr}] {cut_hits} Schneiden- und {pik_hits} Aufsammel-Icons geklickt.")
 
 # ------------------ Hauptloop pro Emulator ------------------
-def gardening_loop(device_addr):
-    # Device verbinden
+def gardening_loop(device_addr, stop=None):
+    """Endlos-Loop für ein Gerät; stop (threading.Event) beendet ihn nach dem laufenden Schritt"""
+    stop = stop or threading.Event()
+    # Device verbinden (simulierte Geräte aus fake_adb brauchen keine Airtest-Verbindung)
+    if not has_backend(device_addr):
+        try:
+            from airtest.core.api import connect_device
+            dev = connect_device(f"Android:///{device_addr}?cap_method=JAVACAP")
+            print(f"[{device_addr}] Device verbunden")
+        except Exception as e:
+            print(f"[{device_addr}] Fehler beim Verbinden: {e}")
+            return
+
+    # Templates auf die Auflösung dieses Emulators bringen (Platten-Cache)
     try:
-        dev = connect_device(f"Android:///{device_addr}?cap_method=JAVACAP")
-        print(f"[{device_addr}] Device verbunden")
+        preload_variants(ALL_TEMPLATES, [device_addr])
     except Exception as e:
-        print(f"[{device_addr}] Fehler beim Verbinden: {e}")
-        return
+        print(f"[{device_addr}] Template-Varianten nicht geladen: {e}")
 
     print(f"\n==============================")
     print(f"🌿 Starte Gardening auf Emulator: {device_addr}")
     print(f"==============================")
 
     fail_count = 0
-    while True:
+    while not stop.is_set():
         planted = 0
         for _ in range(9):
+            if stop.is_set():
+                break
+            heartbeat(device_addr)
             try:
                 if plant_one(device_addr):
                     planted += 1
@@ -118,46 +175,90 @@ def gardening_loop(device_addr):
                 print(f"[{device_addr}] Fehler beim Pflanzen: {e}")
                 fail_count += 1
 
-            time.sleep(0.5)
+            stop.wait(0.5)
             if fail_count >= MAX_FAILS:
-                print(f"[{device_addr}] {fail_count} Fehlversuche – warte 60s.")
+                print(f"[{device_addr}] {fail_count} Fehlversuche – warte {FAIL_BACKOFF_SECONDS}s.")
                 fail_count = 0
-                time.sleep(60)
+                heartbeat(device_addr, expect=FAIL_BACKOFF_SECONDS)
+                stop.wait(FAIL_BACKOFF_SECONDS)
                 break
 
         print(f"[{device_addr}] {planted} Pflanzen gesetzt.")
-
+        log_action("cycle", extra={"planted": planted}, device_addr=device_addr)
+        record_cycle(device_addr, planted)
+        if stop.is_set():
+            break
 
         try:
             water_cut_pick(device_addr)
-            show_live_debug(tpl_list=[FREE_PLACE, WHITE_SEED, RED_SEED, WATER_BTN, DO_CUT, DO_PIK])
+            if LIVE_DEBUG:
+                from raw_airtest_pro_debug import show_live_debug
+                show_live_debug(tpl_list=[FREE_PLACE, WHITE_SEED, RED_SEED, WATER_BTN, DO_CUT, DO_PIK])
         except Exception as e:
             print(f"[{device_addr}] Fehler bei Bewässerung/Ernte: {e}")
 
-        print(f"[{device_addr}] Pause 100 s …")
-        time.sleep(100)
+        print(f"[{device_addr}] Pause {PAUSE_SECONDS} s …")
+        heartbeat(device_addr, expect=PAUSE_SECONDS)
+        stop.wait(PAUSE_SECONDS)
 
         try:
             generate_html_report()
-            close_debug_window()
+            if LIVE_DEBUG:
+                from raw_airtest_pro_debug import close_debug_window
+                close_debug_window()
         except Exception as e:
             print(f"[{device_addr}] Fehler beim Report/DebugWindow: {e}")
 
 # ------------------ Main ------------------
+# Heartbeats, Fristen und Neustarts pro Gerät (device_watchdog)
+WATCHDOG = Watchdog(gardening_loop)
+
+def start_device(device_addr, meta=None):
+    """Startet gardening_loop für ein Gerät unter Aufsicht des Watchdogs (einmal pro Adresse)"""
+    WATCHDOG.supervise(device_addr, meta)
+
+
 if __name__ == "__main__":
-    DEVICE_ADDRS = get_active_emulators()
-    if not DEVICE_ADDRS:
-        print("⚠️  Keine aktiven Emulatoren gefunden.")
-        sys.exit(1)
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Gardening auf allen aktiven Emulatoren")
+    parser.add_argument("--include-unlisted", action="store_true",
+                        help="auch Geräte bearbeiten, die nicht in Emu.csv stehen (z. B. neue Emulatoren)")
+    parser.add_argument("--profile", nargs="?", const="", default=None, metavar="ORDNER",
+                        help="Sampling-Profiler pro Gerät (Standard: logs/profile/<zeit>)")
+    parser.add_argument("--profile-interval", type=float, default=0.01, help="Sekunden zwischen Samples")
+    parser.add_argument("--profile-seconds", type=float, default=0,
+                        help="nach N Sekunden beenden und Profil schreiben (0 = bis Strg+C)")
+    args = parser.parse_args()
 
-    threads = []
-    for addr in DEVICE_ADDRS:
-        t = threading.Thread(target=gardening_loop, args=(addr,), daemon=True)
-        t.start()
-        threads.append(t)
+    init_log_dir()
+    profiler = None
+    if args.profile is not None:
+        from sampling_profiler import SamplingProfiler
+        profiler = SamplingProfiler(args.profile_interval, args.profile or None).start()
+    WATCHDOG.start()
+    tracker = None
+    if ensure_adb_server():
+        # Geräte über den adb-Server verfolgen: neu gestartete Emulatoren sofort bearbeiten
+        tracker = DeviceTracker(on_added=start_device, on_removed=WATCHDOG.release,
+                                include_unlisted=args.include_unlisted or None).start()
+    else:
+        DEVICE_ADDRS = get_active_emulators()
+        if not DEVICE_ADDRS:
+            print("⚠️  Keine aktiven Emulatoren gefunden.")
+            sys.exit(1)
+        for addr in DEVICE_ADDRS:
+            start_device(addr)
 
+    started = time.time()
     try:
-        while True:
+        while not (profiler and args.profile_seconds and time.time() - started >= args.profile_seconds):
             time.sleep(1)
     except KeyboardInterrupt:
         print("\n[INFO] Gardening beendet durch Benutzer.")
+    if tracker:
+        tracker.stop()
+    WATCHDOG.stop()
+    WATCHDOG.print_report()
+    if profiler:
+        profiler.stop()
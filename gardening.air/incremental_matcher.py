@@ -0,0 +1,165 @@
+# -*- encoding: utf-8 -*-
+"""
+incremental_matcher.py
+Inkrementelles Matching für die Dauerüberwachung.
+Funktionen:
+ - Pro Gerät und Template-Set werden der letzte Frame und die Score-Karten gehalten
+ - Neuer Frame wird in Kacheln (TILE Pixel) mit dem alten verglichen
+ - Neu korreliert werden nur Fensterpositionen, deren Fenster eine geänderte Kachel
+   berührt (Kachelbereich + Templategröße); der Rest kommt aus dem Cache
+ - Ändert sich mehr als FULL_REFRESH des Bildes (Screenwechsel), wird komplett
+   neu gerechnet (FFT-Atlas)
+
+Speicher: je Set ein Frame (2,6 MB bei 720×1280 BGR) und eine float32-Karte pro
+Template (~3,5 MB), bei drei Templates also ~13 MB; mit MAX_SETS=4 bis ~50 MB pro Gerät.
+Deshalb gilt zusätzlich ein Gesamtlimit über alle Geräte (INCREMENTAL_CACHE_MB, Standard
+256): darüber werden die am längsten ungenutzten Sets verworfen, deren nächster Frame
+wird wieder voll gerechnet. Bei großen Farmen Limit erhöhen oder mit
+INCREMENTAL_MATCHING=0 ganz abschalten.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+ENABLED = os.environ.get("INCREMENTAL_MATCHING", "1") != "0"
+TILE = 32              # Kachelgröße in Pixeln
+DIFF_THRESHOLD = 12    # größte Kanal-Differenz, ab der eine Kachel als geändert gilt
+FULL_REFRESH = 0.4     # Anteil geänderter Kacheln, ab dem komplett neu gerechnet wird
+MAX_SETS = 4           # Template-Sets pro Gerät im Cache (Flow-States wechseln zwischen wenigen Sets)
+CACHE_MB = float(os.environ.get("INCREMENTAL_CACHE_MB", "256"))  # Gesamtlimit über alle Geräte
+
+
+def changed_tiles(prev, cur, tile=TILE, threshold=DIFF_THRESHOLD):
+    """bool-Raster (Kachelzeilen × Kachelspalten): True = Kachel hat sich geändert"""
+    import cv2
+    import numpy as np
+    diff = cv2.absdiff(prev, cur)
+    if diff.ndim == 3:
+        diff = diff.max(axis=2)
+    h, w = diff.shape
+    th, tw = -(-h // tile), -(-w // tile)
+    if (th * tile, tw * tile) != (h, w):
+        padded = np.zeros((th * tile, tw * tile), diff.dtype)
+        padded[:h, :w] = diff
+        diff = padded
+    return diff.reshape(th, tile, tw, tile).max(axis=(1, 3)) > threshold
+
+
+def dirty_rects(tiles, shape, tile=TILE):
+    """Zusammenhängende geänderte Kacheln -> [(x1, y1, x2, y2)] in Pixeln"""
+    import cv2
+    import numpy as np
+    n, _, stats, _ = cv2.connectedComponentsWithStats(tiles.astype(np.uint8), connectivity=8)
+    h, w = shape[:2]
+    rects = []
+    for x, y, tw, th, _ in stats[1:n]:
+        rects.append((x * tile, y * tile, min(w, (x + tw) * tile), min(h, (y + th) * tile)))
+    return rects
+
+
+class _Entry:
+    __slots__ = ("frame", "maps", "nbytes")
+
+    def __init__(self, frame, maps):
+        self.frame = frame
+        self.maps = maps
+        self.nbytes = frame.nbytes + sum(m.nbytes for m in maps.values())
+
+
+class IncrementalMatcher:
+    def __init__(self, tile=TILE, threshold=DIFF_THRESHOLD, full_refresh=FULL_REFRESH, max_sets=MAX_SETS,
+                 max_bytes=int(CACHE_MB * 1024 * 1024)):
+        self.tile = tile
+        self.threshold = threshold
+        self.full_refresh = full_refresh
+        self.max_sets = max_sets
+        self.max_bytes = max_bytes
+        self._cache = OrderedDict()   # (device_addr, atlas-key) -> _Entry, zuletzt genutzt am Ende
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.full = 0
+        self.partial = 0
+        self.unchanged = 0
+
+    def _get(self, key):
+        with self._lock:
+            return self._cache.get(key)
+
+    def _touch(self, key):
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+
+    def _put(self, key, entry):
+        with self._lock:
+            old = self._cache.pop(key, None)
+            if old is not None:
+                self._bytes -= old.nbytes
+            self._cache[key] = entry
+            self._bytes += entry.nbytes
+            own = [k for k in self._cache if k[0] == key[0]]
+            for k in own[:max(0, len(own) - self.max_sets)]:
+                self._evict(k)
+            # Gesamtlimit: älteste Sets aller Geräte zuerst, der neue Eintrag bleibt immer
+            while self._bytes > self.max_bytes and len(self._cache) > 1:
+                self._evict(next(iter(self._cache)))
+
+    def _evict(self, key):
+        self._bytes -= self._cache.pop(key).nbytes
+
+    def score_maps(self, device_addr, templates, screen, scale=1.0):
+        """
+        Score-Karten für screen, soweit möglich aus dem Cache des Geräts nachgeführt.
+        Die Karten gehören dem Cache: nur lesen.
+        """
+        from template_atlas import compile_templates  # OpenCV/numpy erst beim ersten Matching
+        from admission import MATCHING, admit
+        atlas = compile_templates(templates, scale)
+        key = (device_addr, id(atlas))
+        entry = self._get(key)
+        if entry is not None and entry.frame.shape == screen.shape:
+            tiles = changed_tiles(entry.frame, screen, self.tile, self.threshold)
+            changed = float(tiles.mean())
+            if changed == 0.0:
+                self.unchanged += 1
+                self._touch(key)
+                return entry.maps
+            if changed <= self.full_refresh:
+                rects = dirty_rects(tiles, screen.shape, self.tile)
+                with admit(MATCHING, device_addr):
+                    atlas.rescore(entry.maps, screen, rects)
+                # Referenz nur in geänderten Kacheln nachziehen: langsame Übergänge unter
+                # DIFF_THRESHOLD summieren sich so nicht unbemerkt auf
+                for x1, y1, x2, y2 in rects:
+                    entry.frame[y1:y2, x1:x2] = screen[y1:y2, x1:x2]
+                self.partial += 1
+                self._touch(key)
+                return entry.maps
+
+        with admit(MATCHING, device_addr):
+            maps = atlas.score_maps(screen)
+        self.full += 1
+        self._put(key, _Entry(screen.copy(), maps))
+        return maps
+
+    def match(self, device_addr, templates, screen, scale=1.0):
+        """Wie TemplateAtlas.match_all(screen), Ergebnis {filename: {"result", "confidence"} | None}"""
+        from template_atlas import compile_templates
+        maps = self.score_maps(device_addr, templates, screen, scale)
+        return compile_templates(templates, scale).best(maps)
+
+    def forget(self, device_addr):
+        """Cache eines Geräts verwerfen (z. B. nach Neustart durch den Watchdog)"""
+        with self._lock:
+            for key in [k for k in self._cache if k[0] == device_addr]:
+                self._evict(key)
+
+    def stats(self):
+        total = self.full + self.partial + self.unchanged
+        return {"full": self.full, "partial": self.partial, "unchanged": self.unchanged,
+                "reuse_rate": (self.partial + self.unchanged) / total if total else 0.0,
+                "cache_mb": self._bytes / (1024 * 1024)}
+
+
+INCREMENTAL = IncrementalMatcher()
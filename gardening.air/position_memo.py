@@ -0,0 +1,87 @@
+# -*- encoding: utf-8 -*-
+"""
+position_memo.py
+Letzte Trefferposition pro Emulator und Template.
+Funktionen:
+ - Vor der Vollbildsuche wird nur ein kleiner Patch um die letzte Position
+   korreliert (Template + MEMO_MARGIN Pixel Rand)
+ - Bei Fehlschlag: Eintrag verwerfen, normale Vollbildsuche
+ - Einträge verfallen nach MEMO_TTL Sekunden ohne Bestätigung
+"""
+
+import threading
+import time
+
+MEMO_TTL = 120.0     # Sekunden ohne Treffer, danach wird der Eintrag verworfen
+MEMO_MARGIN = 4      # erlaubte Verschiebung (Pixel) gegenüber der letzten Position
+
+
+class PositionMemo:
+    def __init__(self, ttl=MEMO_TTL, margin=MEMO_MARGIN):
+        self.ttl = ttl
+        self.margin = margin
+        self._entries = {}  # (device, filename) -> (left, top, zeit)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, device_addr, tpl, screen, tpl_img):
+        """
+        Prüft nur die letzte bekannte Position.
+        Gibt {"result": (x, y), "confidence": c} zurück oder None (dann Vollbildsuche).
+        """
+        key = (device_addr, tpl.filename)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return None
+        import cv2
+        left, top, ts = entry
+        if time.time() - ts > self.ttl:
+            self.forget(device_addr, tpl)
+            return None
+
+        h, w = tpl_img.shape[:2]
+        sh, sw = screen.shape[:2]
+        x1, y1 = max(0, left - self.margin), max(0, top - self.margin)
+        x2, y2 = min(sw, left + w + self.margin), min(sh, top + h + self.margin)
+        patch = screen[y1:y2, x1:x2]
+        if patch.shape[0] < h or patch.shape[1] < w:
+            self.forget(device_addr, tpl)
+            return None
+        if not getattr(tpl, "rgb", True):
+            if patch.ndim == 3:
+                patch = cv2.cvtColor(patch, cv2.COLOR_BGR2GRAY)
+            if tpl_img.ndim == 3:
+                tpl_img = cv2.cvtColor(tpl_img, cv2.COLOR_BGR2GRAY)
+
+        res = cv2.matchTemplate(patch, tpl_img, cv2.TM_CCOEFF_NORMED)
+        _, max_val, _, max_loc = cv2.minMaxLoc(res)
+        if max_val < tpl.threshold:
+            self.misses += 1
+            self.forget(device_addr, tpl)
+            return None
+
+        new_left, new_top = x1 + max_loc[0], y1 + max_loc[1]
+        with self._lock:
+            self._entries[key] = (new_left, new_top, time.time())
+        self.hits += 1
+        return {"result": (new_left + w // 2, new_top + h // 2), "confidence": float(max_val)}
+
+    def store(self, device_addr, tpl, match, tpl_img):
+        """Merkt sich einen Treffer der Vollbildsuche (match["result"] = Mittelpunkt)"""
+        h, w = tpl_img.shape[:2]
+        x, y = match["result"]
+        with self._lock:
+            self._entries[(device_addr, tpl.filename)] = (int(x) - w // 2, int(y) - h // 2, time.time())
+
+    def forget(self, device_addr, tpl=None):
+        with self._lock:
+            if tpl is None:
+                for key in [k for k in self._entries if k[0] == device_addr]:
+                    del self._entries[key]
+            else:
+                self._entries.pop((device_addr, tpl.filename), None)
+
+
+POSITION_MEMO = PositionMemo()
@@ -11,10 +11,11 @@ from PIL import Image
 import cv2
 import numpy as np
 from airtest.core.cv import Template
+from adb_discovery import resolve_adb_path
 
 # ------------------ Globales ADB ------------------
-ANDROID_SDK_ADB = r"C:\Users\User\AppData\Local\Android\Sdk\platform-tools\adb.exe"
-ADB_PATH = ANDROID_SDK_ADB
+# $ADB_PATH, Android SDK, PATH oder platform-tools (siehe adb_discovery.resolve_adb_path)
+ADB_PATH = resolve_adb_path()
 
 LOG_DIR = "logs"
 ABS_LOG_DIR = os.path.abspath(LOG_DIR)
@@ -9,29 +9,137 @@ Funktionen:
 """
 
 import os
+import socket
 import subprocess
+import threading
 import time
-from PIL import Image
-import cv2
-import numpy as np
-from airtest.core.cv import Template
+from contextlib import nullcontext
+# PIL / OpenCV / numpy werden erst in den Funktionen importiert (schneller Start)
+from template_spec import Template
 
 # Emulator-Loader
 from emulator_loader import get_active_emulators
+from adb_discovery import resolve_adb_path
+from adb_client import get_client
+from position_memo import POSITION_MEMO
+from admission import SCREENCAPS, MATCHING, INPUTS, admit, polling
+import incremental_matcher
 # ------------------ Globales ADB festlegen ------------------
-ANDROID_SDK_ADB = r"C:\Users\User\AppData\Local\Android\Sdk\platform-tools\adb.exe"
-ADB_PATH = ANDROID_SDK_ADB  # Full path to adb.exe
+# $ADB_PATH, Android SDK, PATH oder platform-tools (siehe adb_discovery.resolve_adb_path)
+ADB_PATH = resolve_adb_path()
+# shell/exec-out direkt über den adb-Server-Socket statt über einen adb-Prozess
+USE_ADB_SOCKET = os.environ.get("ADB_USE_SOCKET", "1") != "0"
+# Fristen (Sekunden) für jeden adb-Aufruf; danach wird der adb-Prozess beendet
+ADB_TIMEOUT = float(os.environ.get("ADB_TIMEOUT", "15"))
+SCREENCAP_TIMEOUT = float(os.environ.get("ADB_SCREENCAP_TIMEOUT", "20"))
 
 LOG_DIR = "logs"
 ABS_LOG_DIR = os.path.abspath(LOG_DIR)
-os.makedirs(ABS_LOG_DIR, exist_ok=True)
+_log_dir_ready = False
+
+
+def init_log_dir():
+    """Legt den Log-Ordner an (früher beim Import, jetzt explizit bzw. beim ersten Screenshot)"""
+    global _log_dir_ready
+    if not _log_dir_ready:
+        os.makedirs(ABS_LOG_DIR, exist_ok=True)
+        _log_dir_ready = True
+    return ABS_LOG_DIR
+
+
+# ------------------ Backend (echtes adb oder Simulator) ------------------
+_BACKENDS = {}
+
+
+def register_backend(device_addr, backend):
+    """
+    Leitet adb_exec/raw_screenshot für device_addr an ein Backend-Objekt um
+    (z. B. fake_adb.FakeAdbDevice). Backend braucht adb_exec(cmd, text) und screencap().
+    """
+    _BACKENDS[device_addr] = backend
+
+
+def unregister_backend(device_addr):
+    _BACKENDS.pop(device_addr, None)
+
+
+def has_backend(device_addr):
+    return device_addr in _BACKENDS
+
+
+def _adb_budget(budget, device_addr, priority=None):
+    """
+    Screenshot-/Eingabe-Kontingent (admission) für echte Geräte. Die Kontingente schützen
+    adb-Server und Emulator-Host; simulierte Geräte (Backend) laufen ohne, sonst bremst
+    das Host-Limit einen Lasttest mit vielen virtuellen Emulatoren aus.
+    """
+    if device_addr in _BACKENDS:
+        return nullcontext()
+    return admit(budget, device_addr, priority)
+
+
+# ------------------ adb-Prozesse mit Frist ------------------
+_RUNNING = {}  # device_addr -> laufende adb-Prozesse
+_RUNNING_LOCK = threading.Lock()
+
+
+def _run_adb(full_cmd, device_addr, timeout, text=True, stdout=None, **kwargs):
+    """
+    Wie subprocess.run(capture_output=True), aber der Prozess ist für kill_adb_processes()
+    sichtbar. Nach `timeout` Sekunden wird er beendet (subprocess.TimeoutExpired).
+    """
+    proc = subprocess.Popen(full_cmd, stdout=stdout or subprocess.PIPE, stderr=subprocess.PIPE,
+                            text=text, **kwargs)
+    with _RUNNING_LOCK:
+        _RUNNING.setdefault(device_addr, set()).add(proc)
+    try:
+        out, err = proc.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.communicate()
+        print(f"[WARN] adb auf {device_addr} nach {timeout}s abgebrochen: {' '.join(full_cmd[3:])}")
+        raise
+    finally:
+        with _RUNNING_LOCK:
+            _RUNNING.get(device_addr, set()).discard(proc)
+    return subprocess.CompletedProcess(full_cmd, proc.returncode, stdout=out, stderr=err)
+
+
+def kill_adb_processes(device_addr):
+    """Beendet alle noch laufenden adb-Prozesse eines Geräts (Watchdog). Gibt die Anzahl zurück."""
+    with _RUNNING_LOCK:
+        procs = list(_RUNNING.get(device_addr, ()))
+    for proc in procs:
+        try:
+            proc.kill()
+        except OSError:
+            pass
+    return len(procs)
 
 
 # ------------------ Emulator Hilfsfunktionen ------------------
-def adb_exec(cmd, device_addr, text=True, **kwargs):
-    """Führe adb-Befehl auf einem bestimmten Emulator aus"""
+def adb_exec(cmd, device_addr, text=True, timeout=ADB_TIMEOUT, **kwargs):
+    """Führe adb-Befehl auf einem bestimmten Emulator aus (höchstens `timeout` Sekunden)"""
+    backend = _BACKENDS.get(device_addr)
+    if backend is not None:
+        return backend.adb_exec(cmd, text=text)
     full_cmd = [ADB_PATH, "-s", device_addr] + cmd
-    return subprocess.run(full_cmd, capture_output=True, text=text, **kwargs)
+    if USE_ADB_SOCKET and cmd and cmd[0] in ("shell", "exec-out"):
+        try:
+            client = get_client()
+            if cmd[0] == "shell":
+                out = client.shell(device_addr, cmd[1:], timeout=timeout)
+            else:
+                out = client.exec_out(device_addr, cmd[1:], timeout=timeout)
+            if text:
+                return subprocess.CompletedProcess(full_cmd, 0, stdout=out.decode("utf-8", "replace"), stderr="")
+            return subprocess.CompletedProcess(full_cmd, 0, stdout=out, stderr=b"")
+        except socket.timeout:
+            # Gerät hängt: nicht noch einmal über das Binary versuchen
+            raise subprocess.TimeoutExpired(full_cmd, timeout)
+        except OSError as e:
+            print(f"[WARN] adb-Socket für {device_addr} fehlgeschlagen ({e}), nutze adb-Binary")
+    return _run_adb(full_cmd, device_addr, timeout, text=text, **kwargs)
 
 
 def get_display_info(device_addr):
@@ -55,6 +163,7 @@ def get_display_info(device_addr):
 
 # ------------------ Viewport-Erkennung ------------------
 def estimate_viewport(screenshot_path, app_ratio=(9, 16)):
+    from PIL import Image
     img = Image.open(screenshot_path)
     screen_w, screen_h = img.size
     target_ratio = app_ratio[0] / app_ratio[1]
@@ -79,12 +188,25 @@ def estimate_viewport(screenshot_path, app_ratio=(9, 16)):
 
 # ------------------ Screenshot ------------------
 def raw_screenshot(device_addr, filename="raw.png", crop=True, viewport=None):
-    raw_path = os.path.join(ABS_LOG_DIR, filename)
+    raw_path = os.path.join(init_log_dir(), filename)
     cmd = ["exec-out", "screencap", "-p"]
-    with open(raw_path, "wb") as f:
-        subprocess.run([ADB_PATH, "-s", device_addr] + cmd, stdout=f, check=True)
+    backend = _BACKENDS.get(device_addr)
+    with _adb_budget(SCREENCAPS, device_addr), open(raw_path, "wb") as f:
+        if backend is not None:
+            f.write(backend.screencap())
+        elif USE_ADB_SOCKET:
+            res = adb_exec(cmd, device_addr, text=False, timeout=SCREENCAP_TIMEOUT)
+            if res.returncode != 0:
+                raise subprocess.CalledProcessError(res.returncode, res.args)
+            f.write(res.stdout)
+        else:
+            res = _run_adb([ADB_PATH, "-s", device_addr] + cmd, device_addr, SCREENCAP_TIMEOUT,
+                           text=False, stdout=f)
+            if res.returncode != 0:
+                raise subprocess.CalledProcessError(res.returncode, res.args)
 
     if crop:
+        from PIL import Image
         if not viewport:
             viewport = estimate_viewport(raw_path)
         img = Image.open(raw_path)
@@ -97,6 +219,7 @@ def raw_screenshot(device_addr, filename="raw.png", crop=True, viewport=None):
 
 # ------------------ Hilfsfunktion: sicheres Laden ------------------
 def load_image_bgr(path):
+    import cv2
     img = cv2.imread(path, cv2.IMREAD_UNCHANGED)
     if img is None:
         print(f"[ERROR] Konnte Bild nicht lesen: {path}")
@@ -108,18 +231,57 @@ def load_image_bgr(path):
     return img
 
 
+_TPL_CACHE = {}
+
+
+def load_template_bgr(path):
+    """Wie load_image_bgr, aber Templates werden nur einmal von der Platte gelesen"""
+    img = _TPL_CACHE.get(path)
+    if img is None:
+        img = load_image_bgr(path)
+        if img is not None:
+            _TPL_CACHE[path] = img
+    return img
+
+
 # ------------------ Template Matching ------------------
-def find_template(tpl: Template, screen_path):
+def find_template(tpl: Template, screen_path, device_addr=None):
+    """
+    Sucht tpl im Screenshot. Mit device_addr wird das Template auf die Geräteauflösung
+    skaliert und zuerst nur die letzte Trefferposition geprüft (position_memo).
+    """
+    import cv2
     screen = load_image_bgr(screen_path)
-    tpl_img = load_image_bgr(tpl.filename)
+    if device_addr is not None:
+        # Template passend zur Auflösung des Geräts (template_variants)
+        from template_variants import device_scale, template_for_device
+        tpl_img = template_for_device(tpl, device_addr)
+    else:
+        tpl_img = load_template_bgr(tpl.filename)
     if screen is None or tpl_img is None:
         return None
-    res = cv2.matchTemplate(screen, tpl_img, cv2.TM_CCOEFF_NORMED)
+    if device_addr is not None:
+        with admit(MATCHING, device_addr):
+            match = POSITION_MEMO.lookup(device_addr, tpl, screen, tpl_img)
+        if match:
+            return match
+    if device_addr is not None and incremental_matcher.ENABLED:
+        # Nur geänderte Bildbereiche neu korrelieren (Score-Karte pro Gerät im Cache)
+        res = incremental_matcher.INCREMENTAL.score_maps(
+            device_addr, [tpl], screen, device_scale(device_addr)).get(tpl.filename)
+        if res is None:
+            return None
+    else:
+        with admit(MATCHING, device_addr):
+            res = cv2.matchTemplate(screen, tpl_img, cv2.TM_CCOEFF_NORMED)
     min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(res)
     if max_val >= tpl.threshold:
         h, w = tpl_img.shape[:2]
         center = (max_loc[0] + w // 2, max_loc[1] + h // 2)
-        return {"result": center, "confidence": float(max_val)}
+        match = {"result": center, "confidence": float(max_val)}
+        if device_addr is not None:
+            POSITION_MEMO.store(device_addr, tpl, match, tpl_img)
+        return match
     return None
 
 
@@ -129,9 +291,12 @@ def exists_raw(device_addr, tpl: Template, viewport=None, timeout=2):
     Gibt absolute Bildschirmkoordinaten (x, y) zurück, auch wenn gecroppt wurde.
     """
     start = time.time()
+    attempt = 0
     while time.time() - start < timeout:
-        path, vp = raw_screenshot(device_addr, "tmp_screen.png", crop=True, viewport=viewport)
-        match = find_template(tpl, path)
+        with polling(device_addr, attempt):
+            path, vp = raw_screenshot(device_addr, "tmp_screen.png", crop=True, viewport=viewport)
+            match = find_template(tpl, path, device_addr)
+        attempt += 1
         if match:
             x, y = match["result"]
             conf = match["confidence"]
@@ -151,12 +316,24 @@ def all_matches_raw(device_addr, tpl: Template, viewport=None):
     """
     Liefert alle Treffer des Templates mit globalen Bildschirmkoordinaten.
     """
+    import cv2
+    import numpy as np
     path, vp = raw_screenshot(device_addr, "tmp_screen.png", crop=True, viewport=viewport)
     screen = load_image_bgr(path)
-    tpl_img = load_image_bgr(tpl.filename)
+    # Template passend zur Auflösung des Geräts (template_variants), mit und ohne Cache
+    from template_variants import device_scale, template_for_device
+    tpl_img = template_for_device(tpl, device_addr)
     if screen is None or tpl_img is None:
         return []
-    res = cv2.matchTemplate(screen, tpl_img, cv2.TM_CCOEFF_NORMED)
+    if incremental_matcher.ENABLED:
+        # Score-Karte des Geräts nachführen statt den ganzen Frame neu zu korrelieren
+        res = incremental_matcher.INCREMENTAL.score_maps(
+            device_addr, [tpl], screen, device_scale(device_addr)).get(tpl.filename)
+        if res is None:
+            return []
+    else:
+        with admit(MATCHING, device_addr):
+            res = cv2.matchTemplate(screen, tpl_img, cv2.TM_CCOEFF_NORMED)
     loc = np.where(res >= tpl.threshold)
     h, w = tpl_img.shape[:2]
     matches = []
@@ -172,16 +349,18 @@ def all_matches_raw(device_addr, tpl: Template, viewport=None):
 
 
 # ------------------ Interaktionen ------------------
-def tap(device_addr, pos):
+def tap(device_addr, pos, priority=None):
     x, y = map(int, pos)
-    adb_exec(["shell", "input", "tap", str(x), str(y)], device_addr)
+    with _adb_budget(INPUTS, device_addr, priority):
+        adb_exec(["shell", "input", "tap", str(x), str(y)], device_addr)
     print(f"[TOUCH] {x},{y}")
 
 
-def swipe(device_addr, start, end, duration=0.5):
+def swipe(device_addr, start, end, duration=0.5, priority=None):
     x1, y1 = map(int, start)
     x2, y2 = map(int, end)
-    adb_exec(["shell", "input", "swipe", str(x1), str(y1), str(x2), str(y2), str(int(duration*1000))], device_addr)
+    with _adb_budget(INPUTS, device_addr, priority):
+        adb_exec(["shell", "input", "swipe", str(x1), str(y1), str(x2), str(y2), str(int(duration*1000))], device_addr)
     print(f"[SWIPE] {start} -> {end}")
 
 
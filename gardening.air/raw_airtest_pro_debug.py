@@ -8,11 +8,19 @@ Live Debug Preview für raw_airtest_pro
 
 import cv2
 import numpy as np
-from raw_airtest_pro import raw_screenshot, find_template
+from raw_airtest_pro import raw_screenshot
+from template_atlas import compile_templates
 
 DEBUG_WINDOW_NAME = "Airtest Live Debug"
-cv2.namedWindow(DEBUG_WINDOW_NAME, cv2.WINDOW_NORMAL)
-cv2.resizeWindow(DEBUG_WINDOW_NAME, 480, 800)  # optional, anpassen
+_window_open = False
+
+def _ensure_window():
+    """Fenster erst beim ersten Anzeigen öffnen (nicht schon beim Import)"""
+    global _window_open
+    if not _window_open:
+        cv2.namedWindow(DEBUG_WINDOW_NAME, cv2.WINDOW_NORMAL)
+        cv2.resizeWindow(DEBUG_WINDOW_NAME, 480, 800)  # optional, anpassen
+        _window_open = True
 
 def show_live_debug(tpl_list=None, viewport=None):
     """
@@ -24,19 +32,25 @@ def show_live_debug(tpl_list=None, viewport=None):
     img = cv2.imread(img_path)
     display_img = img.copy()
 
-    # Templates markieren
+    # Templates markieren (ein gemeinsamer Matching-Durchlauf für alle Templates)
     if tpl_list:
+        atlas = compile_templates(tpl_list)
+        matches = atlas.match_all(img)
         for tpl in tpl_list:
-            match = find_template(tpl, img_path)
+            match = matches.get(tpl.filename)
             if match:
                 x, y = match["result"]
-                w, h = tpl.width, tpl.height
+                w, h = atlas.size(tpl)
                 cv2.rectangle(display_img, (x-w//2, y-h//2), (x+w//2, y+h//2), (0, 255, 0), 2)
                 cv2.putText(display_img, tpl.filename, (x-w//2, y-h//2-5),
                             cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
 
+    _ensure_window()
     cv2.imshow(DEBUG_WINDOW_NAME, display_img)
     cv2.waitKey(1)  # 1 ms warten für Update
 
 def close_debug_window():
-    cv2.destroyWindow(DEBUG_WINDOW_NAME)
+    global _window_open
+    if _window_open:
+        cv2.destroyWindow(DEBUG_WINDOW_NAME)
+        _window_open = False
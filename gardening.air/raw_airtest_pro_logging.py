@@ -13,8 +13,8 @@ import datetime
 import json
 import time
 import threading
-from raw_airtest_pro import ABS_LOG_DIR, find_template, all_matches_raw, tap, swipe, exists_raw
-from airtest.core.api import snapshot, connect_device
+from raw_airtest_pro import ABS_LOG_DIR, init_log_dir, find_template, all_matches_raw, tap, swipe, exists_raw
+import action_db
 
 # ------------------ Thread-Safe Lock ------------------
 log_lock = threading.Lock()
@@ -56,6 +56,12 @@ def log_action(action_type, template_name=None, position=None, confidence=None,
         data.append(entry)
         with open(log_file, "w", encoding="utf-8") as f:
             json.dump(data, f, indent=2, ensure_ascii=False)
+        # Zusätzlich in den SQLite-Index (Hintergrund-Thread, blockiert nicht)
+        try:
+            action_db.record_action(entry, device_addr, source=action_db.source_id(log_file, data[0]),
+                                    seq=len(data) - 1)
+        except Exception as e:
+            print(f"[WARN] action_db: {e}")
     print(f"[LOG][{device_addr}] {entry}")
 
 # ------------------ Screenshot ------------------
@@ -65,6 +71,7 @@ def save_screenshot_with_timestamp(prefix="screenshot", viewport=None, device_ad
     """
     screenshot_path = get_screenshot_path(prefix, device_addr)
     try:
+        from airtest.core.api import snapshot  # Airtest erst laden, wenn wirklich gebraucht
         snapshot(filename=screenshot_path)
         log_action("screenshot", extra={"file": screenshot_path, "viewport": viewport}, device_addr=device_addr)
         return screenshot_path, viewport
@@ -97,7 +104,7 @@ def exists_raw_logged(tpl, viewport=None, timeout=2, device_addr="global"):
     start = time.time()
     while time.time() - start < timeout:
         path, vp = save_screenshot_with_timestamp("exists", viewport, device_addr)
-        match = find_template(tpl, path)
+        match = find_template(tpl, path, device_addr)
         if match:
             log_action("exists", template_name=tpl.filename, position=match["result"],
                        confidence=match["confidence"], extra={"screenshot": path}, device_addr=device_addr)
@@ -143,34 +150,69 @@ def refill_logged(slot_tpl, plus_tpl, green_btn_tpl, viewport=None, device_addr=
     return False
 
 # ------------------ HTML Report ------------------
-def generate_html_report():
+REPORT_ROWS = 1000  # Aktionen im HTML-Report (neueste zuerst)
+
+def _html_summary(hours=24):
+    """Kennzahlen der letzten `hours` Stunden aus action_db (statt alle JSON-Dateien zu scannen)"""
+    try:
+        action_db.flush()
+        conn = action_db.connect()
+        rates = action_db.template_hit_rate(conn, hours)
+        medians = action_db.median_confidence(conn, hours)
+        cycles = action_db.cycles_per_hour(conn, hours)
+        conn.close()
+    except Exception as e:
+        return f"<p>Statistik nicht verfügbar: {e}</p>"
+    html = f"<h3>Templates (letzte {hours} h)</h3><table border='1' cellpadding='5' cellspacing='0'>"
+    html += "<tr><th>Template</th><th>Versuche</th><th>Treffer</th><th>Quote</th><th>Median-Confidence</th></tr>"
+    for t, n, hits, rate in rates:
+        med = medians.get(t)
+        html += f"<tr><td>{t}</td><td>{n}</td><td>{hits}</td><td>{rate:.1%}</td><td>{'' if med is None else f'{med:.3f}'}</td></tr>"
+    html += "</table>"
+    html += f"<h3>Zyklen pro Stunde (letzte {hours} h)</h3><table border='1' cellpadding='5' cellspacing='0'>"
+    html += "<tr><th>Gerät</th><th>Zyklen</th><th>Zyklen/h</th></tr>"
+    for device, n, _, rate in cycles:
+        html += f"<tr><td>{device}</td><td>{n}</td><td>{'-' if rate is None else f'{rate:.1f}'}</td></tr>"
+    html += "</table>"
+    return html
+
+def generate_html_report(hours=24, limit=REPORT_ROWS):
+    """
+    Report aus dem SQLite-Index (action_db): Kennzahlen plus die neuesten `limit` Aktionen
+    der letzten `hours` Stunden. Die actions_log.json-Dateien werden nicht mehr gelesen;
+    ältere Logs vorher mit `python action_db.py ingest` nachladen.
+    """
+    init_log_dir()
     html_file = os.path.join(ABS_LOG_DIR, "actions_report.html")
     html = "<html><head><meta charset='utf-8'><title>Airtest Report</title></head><body>"
     html += f"<h2>Airtest Actions Report - {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</h2>"
+    html += _html_summary(hours)
+    try:
+        conn = action_db.connect()
+        rows = action_db.recent_actions(conn, hours, limit)
+        conn.close()
+    except Exception as e:
+        rows = []
+        html += f"<p>Aktionen nicht verfügbar: {e}</p>"
+    html += f"<h3>Aktionen (neueste {len(rows)}, letzte {hours} h)</h3>"
     html += "<table border='1' cellpadding='5' cellspacing='0'>"
-    html += "<tr><th>Time</th><th>Action</th><th>Template</th><th>Position</th><th>Confidence</th><th>Screenshot</th><th>Extra</th></tr>"
+    html += "<tr><th>Time</th><th>Device</th><th>Action</th><th>Template</th><th>Position</th><th>Confidence</th><th>Screenshot</th><th>Extra</th></tr>"
 
-    for device_dir in os.listdir(ABS_LOG_DIR):
-        log_file = os.path.join(ABS_LOG_DIR, device_dir, "actions_log.json")
-        if os.path.exists(log_file):
-            try:
-                with open(log_file, "r", encoding="utf-8") as f:
-                    log_data = json.load(f)
-            except Exception:
-                continue
-            for entry in log_data:
-                screenshot_link = ""
-                if entry.get("extra") and entry["extra"].get("screenshot"):
-                    screenshot_link = f"<a href='{entry['extra']['screenshot']}' target='_blank'>Bild</a>"
-                html += "<tr>"
-                html += f"<td>{entry['timestamp']}</td>"
-                html += f"<td>{entry['action']}</td>"
-                html += f"<td>{entry['template']}</td>"
-                html += f"<td>{entry['position']}</td>"
-                html += f"<td>{entry['confidence']}</td>"
-                html += f"<td>{screenshot_link}</td>"
-                html += f"<td>{entry.get('extra')}</td>"
-                html += "</tr>"
+    for ts, device, action, template, x, y, confidence, extra in rows:
+        screenshot_link = ""
+        if extra and extra.get("screenshot"):
+            screenshot_link = f"<a href='{extra['screenshot']}' target='_blank'>Bild</a>"
+        position = None if x is None else (x, y)
+        html += "<tr>"
+        html += f"<td>{datetime.datetime.fromtimestamp(ts).strftime(action_db.TIME_FORMAT)}</td>"
+        html += f"<td>{device}</td>"
+        html += f"<td>{action}</td>"
+        html += f"<td>{template}</td>"
+        html += f"<td>{position}</td>"
+        html += f"<td>{confidence}</td>"
+        html += f"<td>{screenshot_link}</td>"
+        html += f"<td>{extra}</td>"
+        html += "</tr>"
 
     html += "</table></body></html>"
     with open(html_file, "w", encoding="utf-8") as f:
@@ -0,0 +1,391 @@
+# -*- encoding: utf-8 -*-
+"""
+sampling_profiler.py
+Sampling-Profiler für echte Läufe (gardening.py --profile).
+Funktionen:
+ - Hintergrund-Thread liest alle INTERVAL Sekunden die Stacks aller Threads
+   (sys._current_frames, kein Tracing -> geringer Overhead)
+ - Zuordnung Thread -> Emulator und Rolle über den Thread-Namen (loop-/input-/recover-<gerät>)
+ - Wanduhrzeit pro Gerät = Zeitleiste des Geräte-Loops; wartet der Loop auf die
+   Eingabe-Queue (FlowContext.drain), zählt das Sample für das, was der input-Thread
+   gerade tut. Leerlaufende Pool-Threads werden nicht gezählt.
+ - Pro Gerät: Collapsed Stacks (<gerät>.folded, für flamegraph.pl / speedscope)
+   und eine SVG-Flamegraph (<gerät>.svg)
+ - Zeitaufteilung pro Gerät: adb, png, match, json_log, sleep, admission, wait, other;
+   zusätzlich pro Thread-Rolle (nur belegte Zeit). sleep = bewusste Pausen (auch
+   stop.wait() im gardening_loop), wait = Warten auf Sperren, Queues, Futures
+ - Vergleich zweier Läufe (Kategorien und Funktionen), z. B. vor/nach einer
+   Änderung an raw_airtest_pro
+
+Ablage: logs/profile/<JJJJMMTT_HHMMSS>/ mit summary.json, *.folded, *.svg
+
+CLI:
+    python sampling_profiler.py report logs/profile/<lauf>
+    python sampling_profiler.py diff logs/profile/<alt> logs/profile/<neu> [--module raw_airtest_pro]
+"""
+
+import datetime
+import json
+import os
+import re
+import sys
+import threading
+import time
+import linecache
+from collections import Counter
+
+from raw_airtest_pro import ABS_LOG_DIR
+
+PROFILE_DIR = os.path.join(ABS_LOG_DIR, "profile")
+INTERVAL = 0.01           # Sekunden zwischen zwei Samples
+MAX_DEPTH = 64
+CATEGORIES = ("adb", "png", "match", "json_log", "sleep", "admission", "wait", "other")
+
+# Thread-Namen der Geräte-Threads: device_watchdog (loop-, recover-), flow_engine (input-)
+_THREAD_NAME = re.compile(r"^(loop|input|recover)-(.+?)(?:_\d+)?$")
+
+# Zuordnung über Dateinamen (innerster Treffer gewinnt)
+_FILE_CATEGORIES = {
+    "adb_client.py": "adb",
+    "subprocess.py": "adb",
+    "template_atlas.py": "match",
+    "incremental_matcher.py": "match",
+    "position_memo.py": "match",
+    "raw_airtest_pro_logging.py": "json_log",
+    "action_db.py": "json_log",
+}
+_FUNC_CATEGORIES = {
+    "_run_adb": "adb",
+    "adb_exec": "adb",
+    "load_image_bgr": "png",
+    "load_template_bgr": "png",
+    "estimate_viewport": "png",
+    "find_template": "match",
+    "all_matches_raw": "match",
+}
+_LINE_PNG = ("imread(", "imwrite(", "Image.open(", ".save(", ".crop(")
+_LINE_WAIT = (".wait(", ".result(", ".acquire(", ".join(")
+# Bewusste Pausen (Datei, Funktion): ein Event.wait/sleep dort ist "sleep", kein "wait"
+_PAUSES = {
+    ("gardening.py", "gardening_loop"),   # stop.wait(): Pause/Fehler-Backoff zwischen den Zyklen
+    ("device_watchdog.py", "_loop"),      # Prüfintervall des Watchdogs
+    ("flow_engine.py", "_sleep"),         # FlowContext.pause() in der Eingabe-Queue
+}
+
+
+def thread_role(name):
+    """Thread-Name -> (rolle, gerät) oder None"""
+    m = _THREAD_NAME.match(name or "")
+    return (m.group(1), m.group(2)) if m else None
+
+
+def device_of_thread(name):
+    role = thread_role(name)
+    return role[1] if role else None
+
+
+def _is_idle(frames):
+    """Pool-Thread (ThreadPoolExecutor) wartet auf Arbeit, führt keinen Auftrag aus"""
+    in_pool = in_item = False
+    for filename, func, _ in frames:
+        if os.path.basename(filename) == "thread.py" and "concurrent" in filename.replace("\\", "/"):
+            in_pool = in_pool or func == "_worker"
+            in_item = in_item or func == "run"
+    return in_pool and not in_item
+
+
+def _waits_on_input(frames):
+    """Geräte-Loop blockiert in FlowContext.drain() auf der Eingabe-Queue"""
+    return any(os.path.basename(f) == "flow_engine.py" and func == "drain" and ".result(" in line
+               for f, func, line in frames)
+
+
+def _stack(frame):
+    """Python-Frame -> [(datei, funktion, zeile)] von innen nach außen"""
+    frames = []
+    while frame is not None and len(frames) < MAX_DEPTH:
+        code = frame.f_code
+        frames.append((code.co_filename, code.co_name,
+                       linecache.getline(code.co_filename, frame.f_lineno).strip()))
+        frame = frame.f_back
+    return frames
+
+
+def _caller(frames):
+    """Innerster Frame außerhalb von threading.py (Event.wait/Condition.wait -> Aufrufer)"""
+    for frame in frames:
+        if os.path.basename(frame[0]) != "threading.py":
+            return frame
+    return frames[-1]
+
+
+def _collapse(frames):
+    return ";".join(f"{os.path.basename(fn)}:{func}" for fn, func, _ in reversed(frames))
+
+
+def _safe(device):
+    return str(device).replace(":", "_")
+
+
+def classify(frames):
+    """frames: [(datei, funktion, zeile)] von innen nach außen -> Kategorie"""
+    if not frames:
+        return "other"
+    caller_file, caller_func, caller_line = _caller(frames)
+    if "sleep(" in caller_line or (
+            (os.path.basename(caller_file), caller_func) in _PAUSES and "wait(" in caller_line):
+        return "sleep"
+    if any(os.path.basename(f) == "admission.py" for f, _, _ in frames):
+        return "admission"
+    for filename, func, line in frames:
+        base = os.path.basename(filename)
+        norm = filename.replace("\\", "/")
+        if "/PIL/" in norm or any(p in line for p in _LINE_PNG):
+            return "png"
+        if "/json/" in norm:
+            return "json_log"
+        category = _FILE_CATEGORIES.get(base) or _FUNC_CATEGORIES.get(func)
+        if category:
+            return category
+    if any(p in frames[0][2] or p in caller_line for p in _LINE_WAIT):
+        return "wait"
+    return "other"
+
+
+# ------------------ Profiler ------------------
+class SamplingProfiler:
+    def __init__(self, interval=INTERVAL, out_dir=None):
+        self.interval = interval
+        self.out_dir = out_dir or os.path.join(PROFILE_DIR, datetime.datetime.now().strftime("%Y%m%d_%H%M%S"))
+        self.stacks = {}       # gerät -> Counter(collapsed stack), Zeitleiste des Loops
+        self.categories = {}   # gerät -> Counter(kategorie), Zeitleiste des Loops
+        self.roles = {}        # gerät -> {rolle: Counter(kategorie)}, nur belegte Threads
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self.started = None
+        self.stopped = None
+
+    def _sample(self):
+        names = {t.ident: t.name for t in threading.enumerate()}
+        own = threading.get_ident()
+        threads = {}  # gerät -> {rolle: frames}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            role = thread_role(names.get(ident))
+            if role is None:
+                continue
+            frames = _stack(frame)
+            if _is_idle(frames):
+                continue
+            threads.setdefault(role[1], {})[role[0]] = frames
+        for device, by_role in threads.items():
+            roles = self.roles.setdefault(device, {})
+            for role, frames in by_role.items():
+                roles.setdefault(role, Counter())[classify(frames)] += 1
+            loop = by_role.get("loop")
+            if loop is None:
+                continue
+            stack, frames = _collapse(loop), loop
+            pending = by_role.get("input")
+            if pending is not None and _waits_on_input(loop):
+                # Loop wartet nur: die Zeit gehört der laufenden Eingabe
+                stack, frames = f"{stack};[input];{_collapse(pending)}", pending
+            self.stacks.setdefault(device, Counter())[stack] += 1
+            self.categories.setdefault(device, Counter())[classify(frames)] += 1
+        self.samples += 1
+
+    def _run(self):
+        next_at = time.perf_counter()
+        while not self._stop.is_set():
+            self._sample()
+            next_at += self.interval
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                self._stop.wait(delay)
+            else:
+                next_at = time.perf_counter()  # Sampler kommt nicht hinterher: nicht aufholen
+
+    def start(self):
+        self.started = time.time()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        print(f"[INFO] Profiler aktiv ({1 / self.interval:.0f} Hz) -> {self.out_dir}")
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.stopped = time.time()
+        return self.write()
+
+    # ---------- Ausgabe ----------
+    def summary(self):
+        duration = (self.stopped or time.time()) - (self.started or time.time())
+        # tatsächlicher Abstand: unter Last schafft der Sampler das Soll-Intervall nicht immer
+        interval = duration / self.samples if self.samples else self.interval
+        devices = {}
+        for device in set(self.categories) | set(self.roles):
+            counts = self.categories.get(device, Counter())
+            total = sum(counts.values())
+            devices[device] = {
+                "samples": total,
+                "seconds": {c: counts.get(c, 0) * interval for c in CATEGORIES},
+                "share": {c: counts.get(c, 0) / total if total else 0.0 for c in CATEGORIES},
+                "threads": {role: {"samples": sum(rc.values()),
+                                   "seconds": {c: rc.get(c, 0) * interval for c in CATEGORIES}}
+                            for role, rc in self.roles.get(device, {}).items()},
+            }
+        return {"interval": interval, "duration": duration, "samples": self.samples, "devices": devices}
+
+    def write(self):
+        os.makedirs(self.out_dir, exist_ok=True)
+        for device, counts in self.stacks.items():
+            path = os.path.join(self.out_dir, f"{_safe(device)}.folded")
+            with open(path, "w", encoding="utf-8") as f:
+                for stack, n in counts.most_common():
+                    f.write(f"{stack} {n}\n")
+            write_flamegraph(counts, os.path.join(self.out_dir, f"{_safe(device)}.svg"), title=str(device))
+        summary = self.summary()
+        with open(os.path.join(self.out_dir, "summary.json"), "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+        print_summary(summary)
+        print(f"[OK] Profil gespeichert: {self.out_dir}")
+        return self.out_dir
+
+
+# ------------------ Flamegraph (SVG) ------------------
+def _tree(counts):
+    root = {"n": 0, "c": {}}
+    for stack, n in counts.items():
+        node = root
+        node["n"] += n
+        for name in stack.split(";"):
+            node = node["c"].setdefault(name, {"n": 0, "c": {}})
+            node["n"] += n
+    return root
+
+
+def _color(name):
+    h = sum(ord(ch) for ch in name) % 60
+    return f"rgb({205 + h % 50},{80 + h * 2},{40 + h % 30})"
+
+
+def write_flamegraph(counts, path, title="", width=1200, row=16):
+    """Einfache SVG-Flamegraph (Wurzel unten, Breite ~ Samples, Tooltip per <title>)"""
+    from xml.sax.saxutils import escape
+    root = _tree(counts)
+    total = max(root["n"], 1)
+    rects = []
+
+    def depth(node):
+        return 1 + max((depth(c) for c in node["c"].values()), default=0)
+
+    height = (depth(root) + 1) * row
+
+    def walk(node, x, level):
+        for name, child in sorted(node["c"].items()):
+            w = child["n"] / total * width
+            if w >= 0.5:
+                y = height - (level + 1) * row
+                label = escape(name) if w > 7 * len(name) else ""
+                rects.append(
+                    f'<g><title>{escape(name)} ({child["n"]} Samples, {child["n"] / total:.1%})</title>'
+                    f'<rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{row - 1}" fill="{_color(name)}"/>'
+                    f'<text x="{x + 3:.1f}" y="{y + row - 4}">{label}</text></g>')
+                walk(child, x, level + 1)
+            x += w
+
+    walk(root, 0.0, 1)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height + row}" '
+                f'font-family="monospace" font-size="11">\n')
+        f.write(f'<text x="4" y="12">{escape(title)} – {root["n"]} Samples</text>\n')
+        f.write("\n".join(rects))
+        f.write("\n</svg>\n")
+
+
+# ------------------ Auswertung / Vergleich ------------------
+def print_summary(summary):
+    print("Gerät (Wanduhr)         " + "".join(f"{c:>10}" for c in CATEGORIES) + "   Sekunden")
+    for device, d in sorted(summary["devices"].items()):
+        print(f"{device:<22}  " + "".join(f"{d['share'][c]:>10.1%}" for c in CATEGORIES) +
+              f"  {sum(d['seconds'].values()):>9.1f}")
+    print("\nThread (belegt, s)      " + "".join(f"{c:>10}" for c in CATEGORIES))
+    for device, d in sorted(summary["devices"].items()):
+        for role, t in sorted(d.get("threads", {}).items()):
+            print(f"{device + '/' + role:<22}  " + "".join(f"{t['seconds'][c]:>10.1f}" for c in CATEGORIES))
+
+
+def load_run(run_dir):
+    with open(os.path.join(run_dir, "summary.json"), "r", encoding="utf-8") as f:
+        summary = json.load(f)
+    functions = Counter()
+    total = 0
+    for name in os.listdir(run_dir):
+        if not name.endswith(".folded"):
+            continue
+        with open(os.path.join(run_dir, name), "r", encoding="utf-8") as f:
+            for line in f:
+                stack, _, n = line.rstrip("\n").rpartition(" ")
+                n = int(n)
+                total += n
+                # inklusive Zeit: jede Funktion einmal pro Stack
+                for frame in set(stack.split(";")):
+                    functions[frame] += n
+    return summary, functions, total
+
+
+def diff_runs(old_dir, new_dir, module=None, top=20):
+    """Vergleicht Zeitanteile (Kategorien, Funktionen) zweier Läufe; gibt die Funktionsliste zurück"""
+    old_summary, old_funcs, old_total = load_run(old_dir)
+    new_summary, new_funcs, new_total = load_run(new_dir)
+
+    def shares(summary):
+        counts = Counter()
+        for d in summary["devices"].values():
+            for c, s in d["seconds"].items():
+                counts[c] += s
+        total = sum(counts.values()) or 1.0
+        return {c: counts[c] / total for c in CATEGORIES}
+
+    old_cat, new_cat = shares(old_summary), shares(new_summary)
+    print("Kategorie        alt      neu     Δ")
+    for c in CATEGORIES:
+        delta = new_cat[c] - old_cat[c]
+        flag = "  <-- " if delta > 0.05 else ""
+        print(f"{c:<12} {old_cat[c]:>7.1%}  {new_cat[c]:>7.1%}  {delta:>+6.1%}{flag}")
+
+    rows = []
+    for frame in set(old_funcs) | set(new_funcs):
+        if module and not frame.startswith(module + ".py:"):
+            continue
+        a = old_funcs.get(frame, 0) / (old_total or 1)
+        b = new_funcs.get(frame, 0) / (new_total or 1)
+        rows.append((b - a, a, b, frame))
+    rows.sort(reverse=True)
+    print(f"\nFunktion (inklusiver Anteil){' in ' + module if module else ''}")
+    for delta, a, b, frame in rows[:top]:
+        print(f"{frame:<60} {a:>7.1%} -> {b:>7.1%}  {delta:>+6.1%}")
+    return rows
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Profile von gardening.py --profile auswerten")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_report = sub.add_parser("report")
+    p_report.add_argument("run")
+    p_diff = sub.add_parser("diff")
+    p_diff.add_argument("old")
+    p_diff.add_argument("new")
+    p_diff.add_argument("--module", default=None, help="nur Funktionen dieses Moduls, z. B. raw_airtest_pro")
+    p_diff.add_argument("--top", type=int, default=20)
+    args = parser.parse_args()
+    if args.command == "report":
+        print_summary(load_run(args.run)[0])
+    else:
+        diff_runs(args.old, args.new, args.module, args.top)
@@ -0,0 +1,285 @@
+# -*- encoding: utf-8 -*-
+"""
+template_atlas.py
+Kompilierte Template-Sets für raw_airtest_pro.
+Funktionen:
+ - Templates einmalig laden und nach Größe + Farbmodus gruppieren
+ - Pro Frame nur EINE Vorverarbeitung (Farbkonvertierung, Mittelwert, FFT, Integralbilder)
+ - TM_CCOEFF_NORMED für alle Templates über das gemeinsame Frame-Spektrum
+ - Ergebnisformat identisch zu find_template(): {"result": (x, y), "confidence": c}
+"""
+
+import threading
+
+import cv2
+import numpy as np
+
+from raw_airtest_pro import load_image_bgr
+from template_variants import template_variant
+
+# Relative Toleranz: Fenster-Varianz <= FLAT_EPS * n * max(1, Mittelwert²) gilt als "flach" (Score 0).
+# Absolut geht nicht: die Varianz aus den Integralbildern (Differenz großer Summen) trägt
+# Rundungsrauschen in der Größenordnung der Fensterenergie, nicht der Fenstervarianz.
+FLAT_EPS = 1e-6
+
+
+# ------------------ Hilfsfunktionen ------------------
+def _template_key(tpl):
+    return (tpl.filename, float(tpl.threshold), bool(getattr(tpl, "rgb", True)))
+
+
+def _channels(img):
+    """Zerlegt ein Bild in float32-Kanäle (1 Kanal bei Graustufen)"""
+    if img.ndim == 2:
+        return [img.astype(np.float32)]
+    return [img[:, :, c].astype(np.float32) for c in range(img.shape[2])]
+
+
+def _window_sums(integral, h, w):
+    """Summe über alle h×w-Fenster aus einem Integralbild (gültiger Bereich)"""
+    return integral[h:, w:] - integral[:-h, w:] - integral[h:, :-w] + integral[:-h, :-w]
+
+
+# ------------------ Frame-Vorverarbeitung ------------------
+class _PreparedFrame:
+    """
+    Einmal pro Frame und Farbmodus berechnet, von allen Templates geteilt:
+    mittelwertfreie Kanäle, deren Spektren und Integralbilder (Summe / Quadratsumme).
+    """
+
+    def __init__(self, img, dft_shape):
+        self.shape = img.shape[:2]
+        self.dft_shape = dft_shape
+        self.spectra = []
+        self.integrals = []
+        self._var_cache = {}
+        for ch in _channels(img):
+            # Mittelwert abziehen: ändert TM_CCOEFF nicht (Template ist mittelwertfrei),
+            # hält aber Spektrum und Quadratsummen numerisch klein.
+            ch -= float(ch.mean())
+            padded = np.zeros(dft_shape, np.float32)
+            padded[:ch.shape[0], :ch.shape[1]] = ch
+            self.spectra.append(cv2.dft(padded))
+            s, sq = cv2.integral2(ch, sdepth=cv2.CV_64F, sqdepth=cv2.CV_64F)
+            self.integrals.append((s, sq))
+
+    def window_norm(self, h, w):
+        """
+        sqrt(Σ Fenster-Varianz über alle Kanäle), je Templategröße nur einmal berechnet.
+        Flache Fenster (Varianz im Rundungsrauschen, siehe FLAT_EPS) bekommen 0.
+        """
+        key = (h, w)
+        norm = self._var_cache.get(key)
+        if norm is None:
+            n = float(h * w)
+            var = tol = None
+            for s, sq in self.integrals:
+                s1 = _window_sums(s, h, w)
+                s2 = _window_sums(sq, h, w)
+                mean_energy = s1 * s1 / n
+                v = s2 - mean_energy
+                t = FLAT_EPS * np.maximum(mean_energy, n)
+                var = v if var is None else var + v
+                tol = t if tol is None else tol + t
+            var[var <= tol] = 0.0
+            norm = np.sqrt(var)
+            self._var_cache[key] = norm
+        return norm
+
+
+# ------------------ Kompiliertes Template ------------------
+class _CompiledTemplate:
+    def __init__(self, tpl, img):
+        self.tpl = tpl
+        self.filename = tpl.filename
+        self.threshold = float(tpl.threshold)
+        self.gray = not bool(getattr(tpl, "rgb", True))
+        self.h, self.w = img.shape[:2]
+        self.image = img  # für Teil-Neuberechnungen per cv2.matchTemplate (rescore)
+        chans = _channels(img)
+        self.zero_mean = [c - float(c.mean()) for c in chans]
+        self.norm = float(np.sqrt(sum(float((c * c).sum()) for c in self.zero_mean)))
+        self._spectra = {}
+        self._lock = threading.Lock()
+
+    def spectra(self, dft_shape):
+        """Template-Spektren je DFT-Größe (bei konstanter Frame-Größe nur einmal)"""
+        spec = self._spectra.get(dft_shape)
+        if spec is None:
+            # Sperre nur für das einmalige Füllen; das Matching selbst läuft parallel
+            with self._lock:
+                spec = self._spectra.get(dft_shape)
+                if spec is None:
+                    spec = []
+                    for c in self.zero_mean:
+                        padded = np.zeros(dft_shape, np.float32)
+                        padded[:self.h, :self.w] = c
+                        spec.append(cv2.dft(padded))
+                    self._spectra[dft_shape] = spec
+        return spec
+
+
+# ------------------ Atlas ------------------
+class TemplateAtlas:
+    """
+    Kompiliertes Template-Set.
+    match_all() berechnet pro Frame die Vorverarbeitung einmal und
+    korreliert danach jedes Template nur noch per Spektrum-Multiplikation.
+    """
+
+    def __init__(self, templates, scale=1.0):
+        self.scale = scale
+        self.entries = []
+        self.groups = {}  # (h, w, gray) -> [Einträge]
+        for tpl in templates:
+            img = template_variant(tpl.filename, scale)
+            if img is None:
+                continue
+            if not getattr(tpl, "rgb", True):
+                img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+            entry = _CompiledTemplate(tpl, img)
+            self.entries.append(entry)
+            self.groups.setdefault((entry.h, entry.w, entry.gray), []).append(entry)
+        print(f"[INFO] TemplateAtlas: {len(self.entries)} Templates in {len(self.groups)} Gruppen")
+
+    def size(self, tpl):
+        """(w, h) eines kompilierten Templates oder None"""
+        for e in self.entries:
+            if e.filename == tpl.filename:
+                return e.w, e.h
+        return None
+
+    def _prepare(self, screen):
+        dft_shape = (cv2.getOptimalDFTSize(screen.shape[0]), cv2.getOptimalDFTSize(screen.shape[1]))
+        frames = {}
+        if any(not gray for (_, _, gray) in self.groups):
+            frames[False] = _PreparedFrame(screen, dft_shape)
+        if any(gray for (_, _, gray) in self.groups):
+            frames[True] = _PreparedFrame(cv2.cvtColor(screen, cv2.COLOR_BGR2GRAY), dft_shape)
+        return frames
+
+    def _correlate(self, frames, sh, sw):
+        """Zähler und Nenner von TM_CCOEFF_NORMED je Template (ohne Sperre, mehrere Geräte parallel)"""
+        parts = {}
+        for (h, w, gray), entries in self.groups.items():
+            if h > sh or w > sw:
+                continue
+            frame = frames[gray]
+            denom_frame = frame.window_norm(h, w)
+            for e in entries:
+                # Kanäle im Frequenzraum aufsummieren -> nur eine inverse DFT pro Template
+                prod = None
+                for f_spec, t_spec in zip(frame.spectra, e.spectra(frame.dft_shape)):
+                    p = cv2.mulSpectrums(f_spec, t_spec, 0, conjB=True)
+                    prod = p if prod is None else prod + p
+                num = cv2.idft(prod, flags=cv2.DFT_REAL_OUTPUT | cv2.DFT_SCALE)[:sh - h + 1, :sw - w + 1]
+                parts[e.filename] = (num, denom_frame * e.norm)
+        return parts
+
+    @staticmethod
+    def _normalize(num, denom):
+        res = np.zeros(num.shape, np.float32)
+        ok = denom > 0.0
+        res[ok] = num[ok] / denom[ok]
+        # wie OpenCV: knapp über 1 ist Rundung (-> ±1), deutlich darüber Rauschen über
+        # einem fast flachen Fenster (-> 0)
+        res[np.abs(res) > 1.125] = 0.0
+        return np.clip(res, -1.0, 1.0)
+
+    def score_maps(self, screen):
+        """TM_CCOEFF_NORMED-Karten aller Templates: {filename: ndarray}"""
+        sh, sw = screen.shape[:2]
+        parts = self._correlate(self._prepare(screen), sh, sw)
+        return {name: self._normalize(num, denom) for name, (num, denom) in parts.items()}
+
+    def score_maps_batch(self, frames):
+        """
+        TM_CCOEFF_NORMED-Karten für viele GLEICH GROSSE Frames: {filename: ndarray (N, H-h+1, W-w+1)}.
+        Template-Spektren geteilt. Frames werden nacheinander vorverarbeitet:
+        mehrere vorbereitete Frames gleichzeitig (Spektren + Integralbilder, ~12 MB je 720p-Frame)
+        sprengen den Cache und waren gemessen langsamer, ebenso ein gestapeltes numpy-FFT.
+        """
+        if not frames:
+            return {}
+        sh, sw = frames[0].shape[:2]
+        maps = {}
+        for f in frames:
+            for name, (num, denom) in self._correlate(self._prepare(f), sh, sw).items():
+                maps.setdefault(name, []).append(self._normalize(num, denom))
+        return {name: np.stack(m) for name, m in maps.items()}
+
+    def _best(self, maps):
+        """{filename: Score-Karte} -> {filename: {"result": (x, y), "confidence": c} | None}"""
+        results = {}
+        for e in self.entries:
+            res = maps.get(e.filename)
+            if res is None:
+                results[e.filename] = None
+                continue
+            _, max_val, _, max_loc = cv2.minMaxLoc(res)
+            if max_val >= e.threshold:
+                center = (max_loc[0] + e.w // 2, max_loc[1] + e.h // 2)
+                results[e.filename] = {"result": center, "confidence": float(max_val)}
+            else:
+                results[e.filename] = None
+        return results
+
+    def match_all(self, screen):
+        """
+        Bestes Match je Template auf einem BGR-Frame.
+        Gibt {filename: {"result": (x, y), "confidence": c} | None} zurück.
+        """
+        return self._best(self.score_maps(screen))
+
+    def rescore(self, maps, screen, rects):
+        """
+        Aktualisiert vorhandene Score-Karten nur dort, wo sich der Frame geändert hat.
+        rects = [(x1, y1, x2, y2)] geänderte Pixelbereiche; neu berechnet werden alle
+        Fensterpositionen, deren Fenster einen dieser Bereiche berührt.
+        """
+        sh, sw = screen.shape[:2]
+        gray_screen = None
+        for e in self.entries:
+            res = maps.get(e.filename)
+            if res is None:
+                continue
+            src = screen
+            if e.gray:
+                if gray_screen is None:
+                    gray_screen = cv2.cvtColor(screen, cv2.COLOR_BGR2GRAY)
+                src = gray_screen
+            for x1, y1, x2, y2 in rects:
+                ys, ye = max(0, y1 - e.h + 1), min(sh - e.h + 1, y2)
+                xs, xe = max(0, x1 - e.w + 1), min(sw - e.w + 1, x2)
+                if ys >= ye or xs >= xe:
+                    continue
+                patch = src[ys:ye + e.h - 1, xs:xe + e.w - 1]
+                res[ys:ye, xs:xe] = cv2.matchTemplate(patch, e.image, cv2.TM_CCOEFF_NORMED)
+        return maps
+
+    def best(self, maps):
+        """Bestes Match je Template aus fertigen Score-Karten (Format wie match_all)"""
+        return self._best(maps)
+
+    def find_all(self, screen_path):
+        """Wie match_all(), aber mit Screenshot-Pfad (analog zu find_template)"""
+        screen = load_image_bgr(screen_path)
+        if screen is None:
+            return {e.filename: None for e in self.entries}
+        return self.match_all(screen)
+
+
+# ------------------ Cache ------------------
+_ATLAS_CACHE = {}
+_ATLAS_LOCK = threading.Lock()
+
+
+def compile_templates(templates, scale=1.0):
+    """Liefert (gecacht) einen TemplateAtlas für genau diese Template-Liste und Skalierung"""
+    key = (scale,) + tuple(_template_key(t) for t in templates)
+    with _ATLAS_LOCK:
+        atlas = _ATLAS_CACHE.get(key)
+        if atlas is None:
+            atlas = TemplateAtlas(templates, scale)
+            _ATLAS_CACHE[key] = atlas
+        return atlas
@@ -0,0 +1,28 @@
+# -*- encoding: utf-8 -*-
+"""
+template_spec.py
+Leichtgewichtiger Ersatz für airtest.core.cv.Template.
+Nur eine Beschreibung (Pfad, Threshold, Farbmodus …) ohne Import von Airtest/OpenCV;
+das Bild selbst wird erst beim Matching geladen (raw_airtest_pro.load_template_bgr).
+"""
+
+
+class Template:
+    """Airtest-kompatible Signatur: Template(filename, threshold=0.7, rgb=False, target_pos=5, ...)"""
+
+    __slots__ = ("filename", "threshold", "rgb", "target_pos", "record_pos", "resolution",
+                 "scale_max", "scale_step")
+
+    def __init__(self, filename, threshold=0.7, target_pos=5, record_pos=None, resolution=(),
+                 rgb=False, scale_max=800, scale_step=0.005):
+        self.filename = filename
+        self.threshold = threshold
+        self.target_pos = target_pos
+        self.record_pos = record_pos
+        self.resolution = resolution
+        self.rgb = rgb
+        self.scale_max = scale_max
+        self.scale_step = scale_step
+
+    def __repr__(self):
+        return f"Template({self.filename!r}, threshold={self.threshold}, rgb={self.rgb})"
@@ -0,0 +1,115 @@
+# -*- encoding: utf-8 -*-
+"""
+template_variants.py
+Auflösungsabhängige Template-Varianten für gemischte Emulator-Flotten (MEmu, LDPlayer …).
+Funktionen:
+ - Skalierungsfaktor pro Gerät aus get_display_info() (App-Viewport-Breite / Referenzbreite)
+ - Templates werden pro Faktor einmal umgerechnet
+ - Festplatten-Cache: <Template-Ordner>/_variants/<sha1>_<faktor>.png, beim Start geladen
+"""
+
+import hashlib
+import os
+import threading
+
+from raw_airtest_pro import get_display_info, load_template_bgr
+
+# Auflösung des App-Viewports, in der die Templates in img/ aufgenommen wurden
+REFERENCE_APP_WIDTH = 720
+APP_RATIO = (9, 16)
+VARIANT_DIR_NAME = "_variants"
+SCALE_TOLERANCE = 0.02   # Abweichungen darunter gelten als 1.0 (kein Umrechnen)
+
+_lock = threading.Lock()
+_device_scale = {}       # device_addr -> faktor
+_variants = {}           # (filename, faktor) -> Bild
+_hashes = {}             # filename -> sha1
+
+
+# ------------------ Skalierung ------------------
+def scale_for_display(w, h, app_ratio=APP_RATIO):
+    """Faktor aus Displaygröße, analog zu estimate_viewport (App-Bereich 9:16)"""
+    if not w or not h:
+        return 1.0
+    w, h = min(w, h), max(w, h)  # Hochformat
+    target_ratio = app_ratio[0] / app_ratio[1]
+    app_w = int(h * target_ratio) if w / h > target_ratio else w
+    scale = round(app_w / REFERENCE_APP_WIDTH, 2)
+    return 1.0 if abs(scale - 1.0) < SCALE_TOLERANCE else scale
+
+
+def device_scale(device_addr):
+    """Faktor für ein Gerät (einmal per adb ermittelt, danach gecacht)"""
+    with _lock:
+        scale = _device_scale.get(device_addr)
+    if scale is None:
+        w, h, _ = get_display_info(device_addr)
+        scale = scale_for_display(w, h)
+        with _lock:
+            _device_scale[device_addr] = scale
+        print(f"[INFO] {device_addr}: Template-Skalierung {scale}")
+    return scale
+
+
+def set_device_scale(device_addr, scale):
+    with _lock:
+        _device_scale[device_addr] = scale
+
+
+# ------------------ Varianten ------------------
+def _file_hash(path):
+    digest = _hashes.get(path)
+    if digest is None:
+        with open(path, "rb") as f:
+            digest = hashlib.sha1(f.read()).hexdigest()[:16]
+        _hashes[path] = digest
+    return digest
+
+
+def variant_path(filename, scale):
+    return os.path.join(os.path.dirname(filename), VARIANT_DIR_NAME,
+                        f"{_file_hash(filename)}_{scale:.2f}.png")
+
+
+def template_variant(filename, scale):
+    """Template-Bild für einen Faktor: Speicher -> Platten-Cache -> neu berechnen"""
+    if scale == 1.0:
+        return load_template_bgr(filename)
+    key = (filename, scale)
+    with _lock:
+        img = _variants.get(key)
+    if img is not None:
+        return img
+
+    import cv2
+    base = load_template_bgr(filename)
+    if base is None:
+        return None
+    path = variant_path(filename, scale)
+    img = cv2.imread(path, cv2.IMREAD_COLOR) if os.path.exists(path) else None
+    if img is None:
+        h, w = base.shape[:2]
+        size = (max(1, int(round(w * scale))), max(1, int(round(h * scale))))
+        interp = cv2.INTER_AREA if scale < 1.0 else cv2.INTER_CUBIC
+        img = cv2.resize(base, size, interpolation=interp)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            cv2.imwrite(path, img)
+        except OSError as e:
+            print(f"[WARN] Variante nicht gespeichert: {path} ({e})")
+    with _lock:
+        _variants[key] = img
+    return img
+
+
+def template_for_device(tpl, device_addr):
+    return template_variant(tpl.filename, device_scale(device_addr))
+
+
+def preload_variants(templates, device_addrs):
+    """Beim Start: Faktoren aller Geräte bestimmen und Varianten laden/erzeugen"""
+    scales = {device_scale(addr) for addr in device_addrs}
+    for scale in scales:
+        for tpl in templates:
+            template_variant(tpl.filename, scale)
+    return scales
@@ -0,0 +1,7 @@
+# -*- encoding: utf-8 -*-
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Module liegen flach in gardening.air/ (kein Paket)
+sys.path.insert(0, os.path.join(ROOT, "gardening.air"))
@@ -0,0 +1,42 @@
+# -*- encoding: utf-8 -*-
+"""action_db: Zyklen pro Stunde und letzte Aktionen für den HTML-Report"""
+
+import time
+
+import pytest
+
+import action_db
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = action_db.connect(str(tmp_path / "actions.sqlite"))
+    yield conn
+    conn.close()
+
+
+def _add(conn, ts, device, action, extra=None, template=None, pos=None):
+    x, y = pos if pos else (None, None)
+    action_db._insert(conn, [(ts, device, action, template, x, y, None, extra, None, None)])
+
+
+def test_cycles_per_hour_counts_intervals(conn):
+    now = time.time()
+    for i in range(4):                     # 4 Zyklen im Abstand von 20 min = 3 pro Stunde
+        _add(conn, now - 3600 + i * 1200, "dev-a", "cycle")
+    _add(conn, now, "dev-b", "cycle")      # ein einzelner Zyklus: keine Rate
+    rows = {device: (n, rate) for device, n, _, rate in action_db.cycles_per_hour(conn)}
+    assert rows["dev-a"][0] == 4 and rows["dev-a"][1] == pytest.approx(3.0)
+    assert rows["dev-b"] == (1, None)
+
+
+def test_recent_actions_newest_first_and_limited(conn):
+    now = time.time()
+    _add(conn, now - 2 * 86400, "dev-a", "tap")   # älter als 24 h
+    for i in range(5):
+        _add(conn, now - 60 + i, "dev-a", "exists", extra='{"screenshot": "s%d.png"}' % i,
+             template="PickUp.png", pos=(i, i))
+    rows = action_db.recent_actions(conn, hours=24, limit=3)
+    assert [r[7]["screenshot"] for r in rows] == ["s4.png", "s3.png", "s2.png"]
+    assert rows[0][4:6] == (4, 4)
+    assert len(action_db.recent_actions(conn, hours=None, limit=100)) == 6
@@ -0,0 +1,45 @@
+# -*- encoding: utf-8 -*-
+"""adb_client gegen fake_adb.FakeAdbServer (adb-Server-Protokoll auf einem lokalen Port)"""
+
+import cv2
+import numpy as np
+import pytest
+
+from adb_client import AdbClient, AdbError
+from fake_adb import DEFAULT_SIZE, FakeAdbDevice, FakeAdbServer, ScreenGraph
+
+
+@pytest.fixture
+def client(tmp_path):
+    frame = np.full((DEFAULT_SIZE[1], DEFAULT_SIZE[0], 3), 90, np.uint8)
+    cv2.imwrite(str(tmp_path / "f0.png"), frame)
+    device = FakeAdbDevice("emu-1", ScreenGraph.from_frames(str(tmp_path)))
+    server = FakeAdbServer({"emu-1": device}).start()
+    client = AdbClient(server.host, server.port, pool_size=1)
+    yield client
+    client.close()
+    server.stop()
+
+
+def test_version(client):
+    assert client.version() == 0x29
+
+
+def test_devices(client):
+    assert client.devices() == "emu-1\tdevice\n"
+
+
+def test_shell(client):
+    assert client.shell("emu-1", ["wm", "size"]) == b"Physical size: 720x1280\n"
+
+
+def test_exec_screencap_size(client):
+    png = client.exec_out("emu-1", ["screencap", "-p"])
+    assert png[:8] == b"\x89PNG\r\n\x1a\n"
+    img = cv2.imdecode(np.frombuffer(png, np.uint8), cv2.IMREAD_COLOR)
+    assert (img.shape[1], img.shape[0]) == DEFAULT_SIZE
+
+
+def test_unknown_serial_raises(client):
+    with pytest.raises(AdbError, match="device not found"):
+        client.shell("emu-404", ["wm", "size"])
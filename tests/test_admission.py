@@ -0,0 +1,32 @@
+# -*- encoding: utf-8 -*-
+"""admission: explizite Priorität und Vorschlag für das Screenshot-Kontingent"""
+
+import admission
+from admission import NORMAL, POLL, REWARD, Budget
+
+
+def test_explicit_priority_overrides_device_priority(monkeypatch):
+    granted = []
+
+    class _Recorder(Budget):
+        def admit(self, priority=NORMAL):
+            granted.append(priority)
+            return super().admit(priority)
+
+    monkeypatch.setattr(admission, "ENABLED", True)
+    budget = _Recorder("test", rate=1000.0)
+    prev = admission.set_priority("adm-test", POLL)
+    try:
+        with admission.admit(budget, "adm-test"):
+            pass
+        with admission.admit(budget, "adm-test", REWARD):
+            pass
+    finally:
+        admission.set_priority("adm-test", prev)
+    assert granted == [POLL, REWARD]
+
+
+def test_suggested_rate_stops_at_saturation():
+    rows = [(1, 4.0, 0.25), (2, 7.8, 0.26), (3, 10.5, 0.29), (4, 11.0, 0.40), (5, 11.2, 0.45)]
+    assert admission.suggest_screencap_rate(rows) == 10.5
+    assert admission.suggest_screencap_rate([]) is None
@@ -0,0 +1,91 @@
+# -*- encoding: utf-8 -*-
+"""flow_engine: Positions-Memo vor dem inkrementellen Matching, Prioritäten"""
+
+import os
+import threading
+
+import cv2
+import numpy as np
+
+import flow_engine
+from admission import NORMAL, POLL, REWARD, priority_of, set_priority
+from incremental_matcher import IncrementalMatcher
+from position_memo import POSITION_MEMO
+from template_spec import Template
+
+IMG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "img")
+NAMES = ("GiesKanne.png", "PickUp.png", "Empty.png")
+
+
+def _frame():
+    frame = cv2.GaussianBlur(np.random.default_rng(0).integers(0, 256, (1280, 720, 3), dtype=np.uint8), (7, 7), 0)
+    tpl = cv2.imread(os.path.join(IMG_DIR, "PickUp.png"))
+    h, w = tpl.shape[:2]
+    frame[600:600 + h, 300:300 + w] = tpl
+    return frame
+
+
+def test_memo_hit_skips_incremental(monkeypatch):
+    monkeypatch.setattr(flow_engine, "device_scale", lambda addr: 1.0)
+    monkeypatch.setattr(flow_engine.incremental_matcher, "ENABLED", True)
+    matcher = IncrementalMatcher()
+    monkeypatch.setattr(flow_engine, "INCREMENTAL", matcher)
+    pick = Template(os.path.join(IMG_DIR, "PickUp.png"), threshold=0.8, rgb=True)
+    frame = _frame()
+
+    ctx = flow_engine.FlowContext("memo-test")
+    try:
+        first = ctx._match(frame, [pick], None)
+        assert first[pick.filename] is not None and matcher.full == 1
+        # Treffer liegt jetzt im Memo: kein weiterer Durchlauf des inkrementellen Matchers
+        second = ctx._match(frame, [pick], None)
+        assert second[pick.filename]["result"] == first[pick.filename]["result"]
+        assert matcher.full + matcher.partial + matcher.unchanged == 1
+
+        # Memo-Fehlschlag (anderes Template): ganzes Set geht in den inkrementellen Matcher
+        empty = Template(os.path.join(IMG_DIR, "Empty.png"), threshold=0.8, rgb=True)
+        third = ctx._match(frame, [pick, empty], None)
+        assert third[empty.filename] is None and third[pick.filename] is not None
+        assert matcher.full == 2
+    finally:
+        ctx.close()
+        POSITION_MEMO.forget("memo-test")
+
+
+def test_queued_input_keeps_priority_from_submit(monkeypatch):
+    monkeypatch.setattr(flow_engine, "device_scale", lambda addr: 1.0)
+    monkeypatch.setattr(flow_engine, "log_action", lambda *a, **kw: None)
+    sent = []
+    monkeypatch.setattr(flow_engine, "tap", lambda addr, pos, priority=None: sent.append(priority))
+    gate = threading.Event()
+
+    ctx = flow_engine.FlowContext("prio-test")
+    prev = set_priority("prio-test", REWARD)
+    try:
+        ctx._submit_input(gate.wait, 5.0)   # Eingabe-Queue blockieren
+        ctx.tap((10, 20))
+        set_priority("prio-test", POLL)     # Priorität ändert sich, bevor der Tap gesendet wird
+        gate.set()
+        ctx.drain()
+    finally:
+        ctx.close()
+        set_priority("prio-test", prev)
+    assert sent == [REWARD]
+
+
+def test_reward_icon_raises_priority(monkeypatch):
+    monkeypatch.setattr(flow_engine, "device_scale", lambda addr: 1.0)
+    pik = Template(os.path.join(IMG_DIR, "PickUp.png"), threshold=0.8, rgb=True)
+    flow = flow_engine.Flow("reward-test", [flow_engine.State("pik", detect=pik)], start="pik", reward=(pik,))
+    ctx = flow_engine.FlowContext("reward-test")
+    prev = set_priority("reward-test", NORMAL)
+    try:
+        flow_engine._track_reward(ctx, flow, {pik.filename: {"result": (1, 2), "confidence": 0.9}})
+        assert priority_of("reward-test") == REWARD
+        flow_engine._track_reward(ctx, flow, {})  # Icon nicht gesucht: Priorität bleibt
+        assert priority_of("reward-test") == REWARD
+        flow_engine._track_reward(ctx, flow, {pik.filename: None})
+        assert priority_of("reward-test") == NORMAL
+    finally:
+        ctx.close()
+        set_priority("reward-test", prev)
@@ -0,0 +1,101 @@
+# -*- encoding: utf-8 -*-
+"""Teil-Neuberechnung (cv2.matchTemplate auf Kacheln) gegen Vollberechnung (FFT-Atlas)"""
+
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from incremental_matcher import IncrementalMatcher
+from template_atlas import compile_templates
+from template_spec import Template
+
+IMG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "img")
+NAMES = ("GiesKanne.png", "PickUp.png", "Empty.png")
+TOLERANCE = 1e-3
+
+
+def _templates(rgb=True):
+    return [Template(os.path.join(IMG_DIR, name), threshold=0.7, rgb=rgb) for name in NAMES]
+
+
+def _frame(rng):
+    frame = cv2.GaussianBlur(rng.integers(0, 256, (1280, 720, 3), dtype=np.uint8), (7, 7), 0)
+    frame[:120] = 0
+    return frame
+
+
+def _paste_template(frame):
+    tpl = cv2.imread(os.path.join(IMG_DIR, "PickUp.png"))
+    h, w = tpl.shape[:2]
+    frame[600:600 + h, 300:300 + w] = tpl
+
+
+def _black_patch(frame):
+    frame[900:1000, 100:260] = 0
+
+
+def _flat_over_black(frame):
+    frame[40:100, 200:400] = 90
+
+
+def _noise_patch(frame):
+    frame[300:360, 500:700] = np.random.default_rng(5).integers(0, 256, (60, 200, 3), dtype=np.uint8)
+
+
+@pytest.mark.parametrize("rgb", [True, False])
+@pytest.mark.parametrize("change", [_paste_template, _black_patch, _flat_over_black, _noise_patch])
+def test_partial_rescore_matches_full(change, rgb):
+    templates = _templates(rgb)
+    matcher = IncrementalMatcher()
+    first = _frame(np.random.default_rng(0))
+    matcher.score_maps("dev", templates, first)
+
+    second = first.copy()
+    change(second)
+    maps = matcher.score_maps("dev", templates, second)
+    assert matcher.partial == 1 and matcher.full == 1
+
+    full = compile_templates(templates).score_maps(second)
+    src = second if rgb else cv2.cvtColor(second, cv2.COLOR_BGR2GRAY)
+    for tpl in templates:
+        img = cv2.imread(tpl.filename)
+        if not rgb:
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        ref = cv2.matchTemplate(src, img, cv2.TM_CCOEFF_NORMED)
+        assert float(np.abs(maps[tpl.filename] - full[tpl.filename]).max()) < TOLERANCE, tpl.filename
+        assert float(np.abs(maps[tpl.filename] - ref).max()) < TOLERANCE, tpl.filename
+
+
+def test_unchanged_frame_reuses_maps():
+    templates = _templates()
+    matcher = IncrementalMatcher()
+    frame = _frame(np.random.default_rng(1))
+    first = matcher.score_maps("dev", templates, frame)
+    again = matcher.score_maps("dev", templates, frame.copy())
+    assert again is first and matcher.unchanged == 1
+
+
+def test_cache_limit_evicts_oldest_device():
+    templates = _templates()
+    frame = _frame(np.random.default_rng(2))
+    probe = IncrementalMatcher()
+    probe.score_maps("a", templates, frame)
+    one_set = probe._bytes
+
+    matcher = IncrementalMatcher(max_bytes=int(one_set * 1.5))
+    matcher.score_maps("a", templates, frame)
+    matcher.score_maps("b", templates, frame)
+    assert matcher._bytes <= matcher.max_bytes
+    matcher.score_maps("b", templates, frame.copy())
+    assert matcher.unchanged == 1
+    matcher.score_maps("a", templates, frame.copy())
+    assert matcher.full == 3
+
+
+def test_forget_releases_memory():
+    matcher = IncrementalMatcher()
+    matcher.score_maps("a", _templates(), _frame(np.random.default_rng(3)))
+    matcher.forget("a")
+    assert matcher._bytes == 0 and matcher.stats()["cache_mb"] == 0
@@ -0,0 +1,74 @@
+# -*- encoding: utf-8 -*-
+"""sampling_profiler.classify: bewusste Pausen (sleep) gegen echtes Warten (wait)"""
+
+import os
+import queue
+import sys
+import threading
+import time
+
+import pytest
+
+import sampling_profiler
+from sampling_profiler import classify
+
+THREADING = os.path.join(os.path.dirname(threading.__file__), "threading.py")
+
+
+def _sample_while(target):
+    """Stack eines Threads, der in target() blockiert"""
+    release = threading.Event()
+    thread = threading.Thread(target=target, args=(release,), daemon=True)
+    thread.start()
+    try:
+        deadline = time.time() + 2.0
+        while time.time() < deadline:
+            frame = sys._current_frames().get(thread.ident)
+            frames = sampling_profiler._stack(frame) if frame is not None else []
+            # Thread ist in target angekommen und blockiert auf einer Sperre
+            if any(func == target.__name__ for _, func, _ in frames) and "acquire(" in frames[0][2]:
+                return frames
+            time.sleep(0.01)
+        pytest.fail("Thread blockiert nicht")
+    finally:
+        release.set()
+        thread.join(2.0)
+
+
+def _event_pause(release):
+    release.wait(5.0)
+
+
+def _queue_wait(release):
+    q = queue.Queue()
+    threading.Thread(target=lambda: (release.wait(5.0), q.put(None)), daemon=True).start()
+    q.get()
+
+
+def _lock_wait(release):
+    lock = threading.Lock()
+    lock.acquire()
+    threading.Thread(target=lambda: (release.wait(5.0), lock.release()), daemon=True).start()
+    lock.acquire()
+
+
+def test_event_wait_in_pause_counts_as_sleep(monkeypatch):
+    frames = _sample_while(_event_pause)
+    assert os.path.basename(frames[0][0]) == "threading.py"
+    assert classify(frames) == "wait"
+    monkeypatch.setattr(sampling_profiler, "_PAUSES",
+                        {(os.path.basename(__file__), "_event_pause")})
+    assert classify(frames) == "sleep"
+
+
+def test_gardening_loop_pause_counts_as_sleep():
+    frames = [(THREADING, "wait", "waiter.acquire(True, timeout)"),
+              (THREADING, "wait", "signaled = self._cond.wait(timeout)"),
+              ("/x/gardening.air/gardening.py", "gardening_loop", "stop.wait(PAUSE_SECONDS)"),
+              ("/x/gardening.air/device_watchdog.py", "_run", "self.target(st.addr)")]
+    assert classify(frames) == "sleep"
+
+
+@pytest.mark.parametrize("target", [_queue_wait, _lock_wait])
+def test_lock_and_queue_waits_stay_wait(target):
+    assert classify(_sample_while(target)) == "wait"
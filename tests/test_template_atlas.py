@@ -0,0 +1,84 @@
+# -*- encoding: utf-8 -*-
+"""TemplateAtlas gegen cv2.matchTemplate (TM_CCOEFF_NORMED) als Referenz"""
+
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from template_atlas import TemplateAtlas
+from template_spec import Template
+
+IMG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "img")
+NAMES = ("GiesKanne.png", "PickUp.png", "Empty.png")
+TOLERANCE = 1e-3
+
+
+def _noisy(rng):
+    return cv2.GaussianBlur(rng.integers(0, 256, (1280, 720, 3), dtype=np.uint8), (7, 7), 0)
+
+
+def _flat(rng):
+    return np.full((1280, 720, 3), 37, np.uint8)
+
+
+def _black_bars(rng):
+    frame = _noisy(rng)
+    frame[:120] = 0
+    frame[-80:] = 0
+    frame[:, :40] = 0
+    return frame
+
+
+def _dark_with_grain(rng):
+    # fast schwarz mit ±1 Rauschen (wie komprimierte Ladebildschirme)
+    return rng.integers(0, 2, (1280, 720, 3), dtype=np.uint8)
+
+
+def _with_template(rng):
+    frame = _black_bars(rng)
+    tpl = cv2.imread(os.path.join(IMG_DIR, "PickUp.png"))
+    h, w = tpl.shape[:2]
+    frame[600:600 + h, 300:300 + w] = tpl
+    return frame
+
+
+def _templates(rgb=True):
+    return [Template(os.path.join(IMG_DIR, name), threshold=0.7, rgb=rgb) for name in NAMES]
+
+
+@pytest.fixture(scope="module")
+def atlas():
+    return TemplateAtlas(_templates())
+
+
+@pytest.mark.parametrize("rgb", [True, False])
+@pytest.mark.parametrize("make_frame", [_noisy, _flat, _black_bars, _dark_with_grain, _with_template])
+def test_score_maps_match_opencv(make_frame, rgb):
+    frame = make_frame(np.random.default_rng(0))
+    templates = _templates(rgb)
+    maps = TemplateAtlas(templates).score_maps(frame)
+    for tpl in templates:
+        img = cv2.imread(tpl.filename)
+        src = frame
+        if not tpl.rgb:
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+            src = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        ref = cv2.matchTemplate(src, img, cv2.TM_CCOEFF_NORMED)
+        assert float(np.abs(maps[tpl.filename] - ref).max()) < TOLERANCE, tpl.filename
+
+
+def test_no_match_on_black_region(atlas):
+    frame = _black_bars(np.random.default_rng(1))
+    for name, hit in atlas.match_all(frame).items():
+        assert hit is None, name
+
+
+def test_batch_equals_single(atlas):
+    rng = np.random.default_rng(2)
+    frames = [_black_bars(rng), _with_template(rng)]
+    stacks = atlas.score_maps_batch(frames)
+    for i, frame in enumerate(frames):
+        for name, res in atlas.score_maps(frame).items():
+            assert np.array_equal(stacks[name][i], res)